@@ -0,0 +1,169 @@
+"""
+Batch analysis of FEN/EPD files, one JSON object per position:
+
+    python -m engine.Analyze positions.epd --out analysis.jsonl
+    python -m engine.Analyze positions.epd.gz --out analysis.jsonl --depth 4 --workers 16
+    python -m engine.Analyze positions.epd.gz --out analysis.jsonl --nodes 20000 --resume
+
+Lines stream from the file to a pool of worker processes through Streams.ordered_map, which parse, analyze and
+serialize them, so memory holds only the chunks in flight however big the input is, and the parent does little more
+than read and write lines. Output comes back in input order, e.g.
+    {"index": 0, "id": "pos 1", "fen": "...", "legal_moves": 20, "material": 0, "check": false, "checkmate": false,
+     "stalemate": false, "best_move": "e2e4", "san": "e4", "score": 35, "mate": null, "depth": 4, "nodes": 1234}
+index counts positions (not blank or comment lines) from 0, material is white's minus black's in centipawns, and
+score is the search's in centipawns for the side to move, with mate the moves to mate (negative when being mated)
+instead when it found one. The search fields are only there when a --depth or --nodes is given and there's a move.
+A line that isn't a position gets {"index", "line", "error"}.
+
+The output is its own checkpoint: --resume keeps the complete lines already written, drops a partly written last
+one, and carries on from the position after them.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from model import Conversions, Evaluation, FEN, SAN, Streams, Tablebase
+from model.Board import Board
+from engine.Search import Search, MATE, MATE_BOUND, MAX_PLY
+from engine.TranspositionTable import TranspositionTable
+
+DEFAULT_HASH_MB = 4
+
+
+class _Analyzer:
+    """
+    Search settings for analyze. Module level state so worker processes keep it.
+    """
+    depth = None
+    nodes = None
+    table = None
+
+
+def _start_analyzer(depth, nodes, hash_mb, tablebase_path):
+    _Analyzer.depth, _Analyzer.nodes = depth, nodes
+    _Analyzer.table = TranspositionTable(hash_mb) if depth or nodes else None
+    if tablebase_path:
+        Board.tablebases = Tablebase.Tablebases(tablebase_path)
+
+
+def analyze(board):
+    """
+    The analysis of board as a dict, searched too when the analyzer has a depth or node limit and there's a move.
+    """
+    moves = board.legal_moves()
+    check = board.in_check()
+    result = {
+        'fen': board.to_fen(),
+        'legal_moves': len(moves),
+        'material': Evaluation.material(board, True) - Evaluation.material(board, False),
+        'check': check,
+        'checkmate': check and not moves,
+        'stalemate': not check and not moves,
+    }
+    if moves and (_Analyzer.depth or _Analyzer.nodes):
+        # a fresh table for every position, so results don't depend on which worker had what before
+        _Analyzer.table.clear()
+        search = Search(board, _Analyzer.table)
+        best = search.search(_Analyzer.depth or MAX_PLY - 1, node_limit=_Analyzer.nodes)
+        score, mate = search.score, None
+        if score > MATE_BOUND:
+            score, mate = None, (MATE - search.score + 1) // 2
+        elif score < -MATE_BOUND:
+            score, mate = None, -((MATE + search.score) // 2)
+        result.update({
+            'best_move': Conversions.move_to_algebraic(best) if best else None,
+            'san': SAN.move_to_san(board, best) if best else None,
+            'score': score,
+            'mate': mate,
+            'depth': search.depth,
+            'nodes': search.nodes,
+        })
+    return result
+
+
+def _analyze_line(item):
+    index, line = item
+    try:
+        record = FEN.parse_fen(line)
+        board = Board(fen=record)
+        board.validate()
+    except (ValueError, IndexError, KeyError) as error:
+        result = {'index': index, 'line': line, 'error': f'not a position: {error}'}
+        return json.dumps(result, separators=(',', ':'))
+    result = {'index': index}
+    if 'id' in record.operations:
+        result['id'] = record.operations['id']
+    try:
+        result.update(analyze(board))
+    except Exception as error:
+        # one bad position mustn't take the worker, and with it the whole run, down
+        result = {'index': index, 'line': line, 'error': f'analysis failed: {error!r}'}
+    return json.dumps(result, separators=(',', ':'))
+
+
+def completed(path):
+    """
+    How many complete lines the output at path holds, after cutting off a partly written last line.
+    """
+    if not os.path.exists(path):
+        return 0
+    count = end = offset = 0
+    with open(path, 'rb+') as out:
+        for block in iter(lambda: out.read(1 << 20), b''):
+            newlines = block.count(b'\n')
+            if newlines:
+                count += newlines
+                end = offset + block.rindex(b'\n') + 1
+            offset += len(block)
+        if end < offset:
+            out.truncate(end)
+    return count
+
+
+def run(source, out_path, depth=None, nodes=None, workers=None, chunk_size=64, hash_mb=DEFAULT_HASH_MB,
+        tablebase_path=None, resume=False, log=None):
+    """
+    Analyzes every position in source into out_path as JSON lines, returning the number of positions written.
+    """
+    done = completed(out_path) if resume else 0
+    items = islice(enumerate(FEN.iter_lines(source)), done, None)
+    start = time.perf_counter()
+    written = 0
+    with open(out_path, 'a' if resume else 'w') as out:
+        for line in Streams.ordered_map(_analyze_line, items, workers=workers, chunk_size=chunk_size,
+                                        initializer=_start_analyzer,
+                                        initargs=(depth, nodes, hash_mb, tablebase_path)):
+            out.write(line + '\n')
+            written += 1
+            if not written % chunk_size:
+                out.flush()
+    if log:
+        seconds = time.perf_counter() - start
+        skipped = f', {done} already done' if done else ''
+        log(f'{written} positions in {seconds:.1f}s ({written / max(seconds, 1e-9):.0f}/s){skipped}')
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyzes every position of a FEN/EPD file into JSON lines.')
+    parser.add_argument('source', help='FEN or EPD file, optionally gzipped')
+    parser.add_argument('--out', required=True, help='JSON lines output')
+    parser.add_argument('--depth', type=int, help='search every position to this depth')
+    parser.add_argument('--nodes', type=int, help='search every position for this many nodes')
+    parser.add_argument('--workers', type=int, help='processes to analyze with (default one per CPU, 0 for none)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='positions sent to a worker at a time')
+    parser.add_argument('--hash', type=float, default=DEFAULT_HASH_MB, help='megabytes of table per worker')
+    parser.add_argument('--tablebases', help='directory of engine/Retrograde tables to score endgames from')
+    parser.add_argument('--resume', action='store_true', help='carry on after the positions already in --out')
+    args = parser.parse_args(argv)
+
+    run(args.source, args.out, args.depth, args.nodes, args.workers, args.chunk_size, args.hash, args.tablebases,
+        args.resume, log=lambda message: print(message, file=sys.stderr))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
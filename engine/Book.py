@@ -0,0 +1,213 @@
+"""
+Polyglot (.bin) opening books: probing by binary search over an mmap of the file, and building one from games.
+
+A book is a sorted array of 16 byte big endian entries: key (8 bytes, see model/Polyglot), move (2), weight (2) and
+learn (4). Moves pack to file, to row, from file, from row (3 bits each, row 0 is the first rank) and promotion (3
+bits, 1 knight to 4 queen). Castling is written as the king taking its own rook, e1h1 rather than e1g1.
+
+Opening the book maps it without reading it, and a probe touches about log2(entries) pages, so there is no load step
+however big the book is.
+
+    python -m engine.Book build games.pgn --out book.bin --plies 24
+    python -m engine.Book build openings.epd --out book.bin      # from EPD bm operations
+    python -m engine.Book probe book.bin --fen '...'
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from collections import defaultdict
+
+from model import Conversions, FEN, PGN, SAN
+from model.Board import Board
+
+ENTRY = struct.Struct('>QHHI')
+ENTRY_BYTES = ENTRY.size
+
+_PROMOTION_CODES = {None: 0, 'knight': 1, 'bishop': 2, 'rook': 3, 'queen': 4}
+_PROMOTIONS = {code: kind for kind, code in _PROMOTION_CODES.items()}
+
+# our castling move (king two squares) -> Polyglot's (king onto rook), and back
+_CASTLES = {(60, 62): (60, 63), (60, 58): (60, 56), (4, 6): (4, 7), (4, 2): (4, 0)}
+_UNCASTLES = {polyglot: ours for ours, polyglot in _CASTLES.items()}
+
+
+def _polyglot_square(square):
+    return (7 - (square >> 3)) * 8 + (square & 7)
+
+
+def _square(polyglot_square):
+    return (7 - (polyglot_square >> 3)) * 8 + (polyglot_square & 7)
+
+
+def encode_move(board, move):
+    from_square, to_square, promotion = move
+    piece = board.board[from_square >> 3][from_square & 7]
+    if piece.kind == 'king' and (from_square, to_square) in _CASTLES:
+        from_square, to_square = _CASTLES[from_square, to_square]
+    return _polyglot_square(to_square) | _polyglot_square(from_square) << 6 | _PROMOTION_CODES[promotion] << 12
+
+
+def decode_move(board, code):
+    from_square, to_square = _square(code >> 6 & 63), _square(code & 63)
+    piece = board.board[from_square >> 3][from_square & 7]
+    if piece and piece.kind == 'king' and (from_square, to_square) in _UNCASTLES:
+        from_square, to_square = _UNCASTLES[from_square, to_square]
+    return from_square, to_square, _PROMOTIONS[code >> 12 & 7]
+
+
+class Book:
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY_BYTES
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def _key_at(self, index):
+        return struct.unpack_from('>Q', self.map, index * ENTRY_BYTES)[0]
+
+    def entries(self, key):
+        """
+        Every (move code, weight, learn) stored for key.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count:
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.map, low * ENTRY_BYTES)
+            if entry_key != key:
+                break
+            found.append((move, weight, learn))
+            low += 1
+        return found
+
+    def moves(self, board):
+        """
+        (move, weight) for the book's legal moves in board's position, heaviest first.
+        """
+        legal = board.legal_moves()
+        moves = []
+        for code, weight, _ in self.entries(board.polyglot_key()):
+            move = decode_move(board, code)
+            if move in legal:
+                moves.append((move, weight))
+        return sorted(moves, key=lambda pair: pair[1], reverse=True)
+
+    def choose(self, board, randomness=None):
+        """
+        A book move for board, or None. Picks at random in proportion to weight when given a random.Random,
+        otherwise the heaviest.
+        """
+        moves = self.moves(board)
+        if not moves:
+            return None
+        if randomness is None or not sum(weight for _, weight in moves):
+            return moves[0][0]
+        return randomness.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def collect_pgn(path, plies, counts=None):
+    """
+    Adds the first plies moves of every game in path to counts, {(key, move code): weight}, scoring each move
+    2 when its side went on to win, 1 for a draw and 0 for a loss, as Polyglot's own book maker does.
+    """
+    counts = counts if counts is not None else defaultdict(int)
+    for game in PGN.iter_games(path):
+        white_score = {'1-0': 2, '0-1': 0, '1/2-1/2': 1}.get(game.result)
+        if white_score is None:
+            continue
+        try:
+            for ply, (board, move, _) in enumerate(PGN.replay(game)):
+                if ply >= plies:
+                    break
+                score = white_score if board.white_to_move else 2 - white_score
+                counts[board.polyglot_key(), encode_move(board, move)] += score
+        except ValueError:
+            # skip the rest of a game with a move we can't read
+            continue
+    return counts
+
+
+def collect_epd(path, counts=None):
+    """
+    Adds the best moves (bm operations) of every position in an EPD file to counts.
+    """
+    counts = counts if counts is not None else defaultdict(int)
+    for line in FEN.iter_lines(path):
+        try:
+            record = FEN.parse_fen(line)
+            if 'bm' not in record.operations:
+                continue
+            board = Board(fen=record)
+            moves = [encode_move(board, SAN.san_to_move(board, san)) for san in record.operations['bm'].split()]
+        except (ValueError, IndexError, KeyError):
+            # skip a position or best move we can't read, all of its moves so none are half counted
+            continue
+        key = board.polyglot_key()
+        for move in moves:
+            counts[key, move] += 1
+    return counts
+
+
+def write_book(counts, path):
+    """
+    Writes counts as a Polyglot book, weights scaled into 16 bits. Moves that never scored are left out.
+    """
+    top = max(counts.values(), default=0)
+    scale = 65535 / top if top > 65535 else 1
+    entries = sorted(((key, move, max(1, int(weight * scale))) for (key, move), weight in counts.items() if weight),
+                     key=lambda entry: (entry[0], -entry[2]))
+    with open(path, 'wb') as out:
+        for key, move, weight in entries:
+            out.write(ENTRY.pack(key, move, weight, 0))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Polyglot opening books.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from PGN games or EPD bm operations')
+    build.add_argument('sources', nargs='+')
+    build.add_argument('--out', required=True)
+    build.add_argument('--plies', type=int, default=20, help='how deep into each game to take moves')
+    probe = commands.add_parser('probe', help='list the book moves for a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        counts = defaultdict(int)
+        for source in args.sources:
+            if source.endswith(('.pgn', '.pgn.gz')):
+                collect_pgn(source, args.plies, counts)
+            else:
+                collect_epd(source, counts)
+        print(f'{write_book(counts, args.out)} entries written to {args.out}')
+    else:
+        board = Board(fen=args.fen)
+        with Book(args.book) as book:
+            for move, weight in book.moves(board):
+                print(f'{SAN.move_to_san(board, move)} ({Conversions.move_to_algebraic(move)})  weight {weight}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
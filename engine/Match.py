@@ -0,0 +1,405 @@
+"""
+Self-play matches between two configurations of the engine, for telling whether a change makes it stronger:
+
+    python -m engine.Match --new nodes=4000 --base nodes=2000 --openings openings.epd --games 2000
+    python -m engine.Match --new dir=. --base dir=../baseline --tc 10+0.1 --workers 8 --pgn games.pgn
+
+Each side is a spec of comma separated key=value pairs: dir, the checkout to run engine/UCI from (default .), name,
+the go limits nodes, depth and movetime (milliseconds), and anything else as a UCI option (hash=64, bookfile=...).
+--tc base+increment, in seconds, puts both sides on a clock as well, and running out of it loses.
+
+Every opening (FEN or EPD lines) is played twice, once with each side as white, and never again: the engines are
+deterministic under node or depth limits, so a replayed pair would only count the same games twice. Games run on a
+pool of worker processes through Streams.ordered_map, each worker keeping its own pair of engine processes for all its
+games. A game that isn't over is adjudicated as a draw on repetition, the fifty move rule, insufficient material or
+the ply limit, and as a win once one side has been at least --material centipawns ahead for --material-plies plies.
+
+Results are tested with a sequential probability ratio test: the log likelihood ratio of the new side being elo1
+rather than elo0 Elo stronger, from the normal approximation to the score of the games so far. The match stops as
+soon as it crosses log(beta / (1 - alpha)) (accept elo0: no better) or log((1 - beta) / alpha) (accept elo1).
+"""
+import argparse
+import math
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from itertools import islice
+
+from model import Conversions, Evaluation, FEN, SAN, Streams
+from model.Board import Board
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+LIMITS = ('nodes', 'depth', 'movetime')
+# time forfeits allow for this much on top of the clock, for the pipe round trip
+TIME_MARGIN_MS = 100
+
+# directory, name, go limits as (key, value) pairs, UCI options as (name, value) pairs
+EngineSpec = namedtuple('EngineSpec', ['directory', 'name', 'limits', 'options'])
+
+
+def parse_spec(text, default_name):
+    fields = dict(field.split('=', 1) for field in text.split(',') if field) if text else {}
+    directory = fields.pop('dir', '.')
+    name = fields.pop('name', default_name)
+    limits = tuple((key, int(fields.pop(key))) for key in LIMITS if key in fields)
+    return EngineSpec(directory, name, limits, tuple(fields.items()))
+
+
+def parse_tc(text):
+    """
+    (base, increment) in milliseconds from base+increment in seconds, e.g. 10+0.1, or None.
+    """
+    if not text:
+        return None
+    base, _, increment = text.partition('+')
+    return int(float(base) * 1000), int(float(increment or 0) * 1000)
+
+
+class EngineError(Exception):
+    pass
+
+
+class UCIPlayer:
+    """
+    One engine process, driven over UCI.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.process = subprocess.Popen([sys.executable, '-m', 'engine.UCI'], cwd=spec.directory, text=True,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=1)
+        self.send('uci')
+        self.wait_for('uciok')
+        for name, value in spec.options:
+            self.send(f'setoption name {name} value {value}')
+        self.ready()
+
+    def send(self, line):
+        try:
+            self.process.stdin.write(line + '\n')
+        except (BrokenPipeError, OSError):
+            raise EngineError(f'{self.spec.name} has exited')
+
+    def wait_for(self, prefix):
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise EngineError(f'{self.spec.name} has exited')
+            if line.startswith(prefix):
+                return line.split()
+
+    def ready(self):
+        self.send('isready')
+        self.wait_for('readyok')
+
+    def new_game(self):
+        self.send('ucinewgame')
+        self.ready()
+
+    def go(self, fen, moves, clocks=None):
+        """
+        (move text, seconds taken) for the position after moves from fen.
+        """
+        self.send(f'position fen {fen}' + (f' moves {" ".join(moves)}' if moves else ''))
+        fields = [f'{key} {value}' for key, value in self.spec.limits]
+        if clocks:
+            (white_time, black_time), increment = clocks
+            fields.append(f'wtime {white_time} btime {black_time} winc {increment} binc {increment}')
+        start = time.perf_counter()
+        self.send('go ' + ' '.join(fields))
+        move = self.wait_for('bestmove')[1]
+        return move, time.perf_counter() - start
+
+    def close(self):
+        try:
+            self.send('quit')
+            self.process.stdin.close()
+        except (EngineError, OSError):
+            pass
+        self.process.wait()
+
+
+class _Players:
+    """
+    The two engines of a worker process. Module level state so worker processes keep it.
+    """
+    specs = None
+    players = None
+    # (tc, max_plies, material, material_plies) for play
+    settings = None
+
+    @classmethod
+    def player(cls, new):
+        if cls.players[new] is None:
+            cls.players[new] = UCIPlayer(cls.specs[new])
+        return cls.players[new]
+
+    @classmethod
+    def drop(cls, new):
+        if cls.players[new] is not None:
+            cls.players[new].close()
+            cls.players[new] = None
+
+    @classmethod
+    def close(cls):
+        if cls.players:
+            for new in (True, False):
+                cls.drop(new)
+
+
+def _start_players(new_spec, base_spec, settings):
+    _Players.specs = {True: new_spec, False: base_spec}
+    _Players.players = {True: None, False: None}
+    _Players.settings = settings
+
+
+def play(task, tc=None, max_plies=400, material=900, material_plies=8):
+    """
+    Plays one game of a (index, opening fen, whether the new side has white) task, returning a dict of index,
+    fen, new_white, result ('1-0', '0-1' or '1/2-1/2'), reason and san (the moves).
+    """
+    index, fen, new_white = task
+    board = Board(fen=fen)
+    sides = {True: new_white, False: not new_white}
+    for new in (True, False):
+        _Players.player(new).new_game()
+    clocks = {True: tc[0], False: tc[0]} if tc else None
+    moves, sans = [], []
+    ahead_for, leader = 0, None
+
+    def finish(result, reason):
+        return {'index': index, 'fen': fen, 'new_white': new_white, 'result': result, 'reason': reason, 'san': sans}
+
+    def loss(white, reason):
+        return finish('0-1' if white else '1-0', reason)
+
+    while True:
+        legal = board.legal_moves()
+        if not legal:
+            if board.in_check():
+                return loss(board.white_to_move, 'checkmate')
+            return finish('1/2-1/2', 'stalemate')
+        if board.is_draw():
+            return finish('1/2-1/2', 'draw rules')
+        if len(moves) >= max_plies:
+            return finish('1/2-1/2', 'ply limit')
+
+        white = board.white_to_move
+        new = sides[white]
+        try:
+            text, seconds = _Players.player(new).go(fen, moves, ((clocks[True], clocks[False]), tc[1]) if tc else None)
+        except EngineError as error:
+            _Players.drop(new)
+            return loss(white, str(error))
+        if tc:
+            clocks[white] -= int(seconds * 1000)
+            if clocks[white] < -TIME_MARGIN_MS:
+                return loss(white, 'time forfeit')
+            clocks[white] = max(clocks[white], 0) + tc[1]
+        try:
+            move = Conversions.algebraic_to_move(text)
+        except (KeyError, IndexError, ValueError):
+            move = None
+        if move not in legal:
+            return loss(white, f'illegal move {text}')
+        sans.append(SAN.move_to_san(board, move))
+        board.make_move(move)
+        moves.append(text)
+
+        if material:
+            balance = Evaluation.material(board, True) - Evaluation.material(board, False)
+            side = balance > 0 if abs(balance) >= material else None
+            ahead_for = ahead_for + 1 if side is not None and side == leader else int(side is not None)
+            leader = side
+            if ahead_for >= material_plies:
+                return loss(not leader, 'material')
+
+
+def _play_task(task):
+    return play(task, *_Players.settings)
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_stats(wins, draws, losses):
+    """
+    (mean score per game, variance of one game's score) for the new side.
+    """
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    return score, variance
+
+
+def elo_interval(wins, draws, losses, z=1.96):
+    """
+    (Elo, margin) of the new side, the margin for a 95% confidence interval by default.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    score, variance = score_stats(wins, draws, losses)
+    deviation = z * math.sqrt(variance / games)
+    low, high = elo(score - deviation), elo(score + deviation)
+    return elo(score), (high - low) / 2
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """
+    Log likelihood ratio of elo1 over elo0, with the score of a game taken as normally distributed.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    score, variance = score_stats(wins, draws, losses)
+    if variance <= 0:
+        return 0.0
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    return (score1 - score0) * (2 * score - score0 - score1) * games / (2 * variance)
+
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def _pgn(game, specs, tc):
+    new, base = specs[True].name, specs[False].name
+    white, black = (new, base) if game['new_white'] else (base, new)
+    tags = [('Event', 'engine.Match'), ('Round', game['index'] + 1), ('White', white), ('Black', black),
+            ('Result', game['result']), ('Termination', game['reason'])]
+    if tc:
+        tags.append(('TimeControl', f'{tc[0] / 1000:g}+{tc[1] / 1000:g}'))
+    if game['fen'] != START_FEN:
+        tags += [('SetUp', 1), ('FEN', game['fen'])]
+    board = Board(fen=game['fen'])
+    number, white_to_move = board.move_number, board.white_to_move
+    words = [] if white_to_move else [f'{number}...']
+    for san in game['san']:
+        if white_to_move:
+            words.append(f'{number}.')
+        words.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    words.append(game['result'])
+    lines, line = [], ''
+    for word in words:
+        if len(line) + len(word) >= 80:
+            lines.append(line)
+            line = ''
+        line = f'{line} {word}' if line else word
+    lines.append(line)
+    return '\n'.join(f'[{name} "{value}"]' for name, value in tags) + '\n\n' + '\n'.join(lines) + '\n\n'
+
+
+def run(new_spec, base_spec, openings, games, workers=None, tc=None, max_plies=400, material=900, material_plies=8,
+        elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05, pgn=None, out=sys.stdout):
+    """
+    Plays up to games games, no more than two per opening, stopping early once the SPRT decides. Returns (wins,
+    draws, losses, llr) for the new side.
+    """
+    specs = {True: new_spec, False: base_spec}
+    pairs = openings[:(games + 1) // 2]
+    tasks = islice(((index * 2 + swap, fen, not swap) for index, fen in enumerate(pairs) for swap in (0, 1)), games)
+    lower, upper = sprt_bounds(alpha, beta)
+    wins = draws = losses = 0
+    llr = 0.0
+    pgn_file = open(pgn, 'w') if pgn else None
+    try:
+        for game in Streams.ordered_map(_play_task, tasks, workers=workers, chunk_size=1,
+                                        initializer=_start_players,
+                                        initargs=(new_spec, base_spec, (tc, max_plies, material, material_plies))):
+            new_won = {'1-0': game['new_white'], '0-1': not game['new_white']}.get(game['result'])
+            if new_won is None:
+                draws += 1
+            elif new_won:
+                wins += 1
+            else:
+                losses += 1
+            if pgn_file:
+                pgn_file.write(_pgn(game, specs, tc))
+            llr = sprt_llr(wins, draws, losses, elo0, elo1)
+            if wins and losses:
+                difference, margin = elo_interval(wins, draws, losses)
+                difference += 0.0  # so an even score prints as +0.0 rather than -0.0
+                rating = f'{difference:+.1f} +/- {margin:.1f}'
+            else:
+                # a score of 0 or 1 has no finite Elo, and draws alone no spread
+                rating = 'n/a'
+            print(f'{wins + draws + losses:5} games  +{wins} ={draws} -{losses}  Elo {rating}  '
+                  f'LLR {llr:+.2f} [{lower:.2f}, {upper:.2f}]  '
+                  f'({game["result"]} {game["reason"]})', file=out)
+            if not lower < llr < upper:
+                break
+    finally:
+        _Players.close()
+        if pgn_file:
+            pgn_file.close()
+
+    if llr >= upper:
+        print(f'H1 accepted: {new_spec.name} is at least {elo1:g} Elo stronger than {base_spec.name}', file=out)
+    elif llr <= lower:
+        print(f'H0 accepted: {new_spec.name} is not {elo1:g} Elo stronger than {base_spec.name}', file=out)
+    else:
+        print('no decision, play more games', file=out)
+    return wins, draws, losses, llr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plays two engine configurations against each other, with SPRT.')
+    parser.add_argument('--new', default='', help='spec of the side being tested, e.g. dir=.,nodes=4000,hash=16')
+    parser.add_argument('--base', default='', help='spec of the side it is measured against')
+    parser.add_argument('--openings', required=True, help='FEN/EPD file of starting positions, each played twice')
+    parser.add_argument('--games', type=int, default=1000, help='most games to play (at most two per opening)')
+    parser.add_argument('--workers', type=int, help='games at once (default one per CPU, 0 for one in this process)')
+    parser.add_argument('--tc', help='clock for both sides, base+increment in seconds, e.g. 10+0.1')
+    parser.add_argument('--max-plies', type=int, default=400, help='plies before a game is adjudicated drawn')
+    parser.add_argument('--material', type=int, default=900,
+                        help='centipawns ahead to adjudicate a win at, 0 to never adjudicate on material')
+    parser.add_argument('--material-plies', type=int, default=8, help='plies the lead must last')
+    parser.add_argument('--elo0', type=float, default=0.0)
+    parser.add_argument('--elo1', type=float, default=5.0)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--pgn', help='write the games to this PGN file')
+    args = parser.parse_args(argv)
+
+    new_spec, base_spec = parse_spec(args.new, 'new'), parse_spec(args.base, 'base')
+    tc = parse_tc(args.tc)
+    if not tc and not (new_spec.limits and base_spec.limits):
+        parser.error('give each side nodes, depth or movetime, or both a --tc')
+    for spec in (new_spec, base_spec):
+        if not os.path.exists(os.path.join(spec.directory, 'engine', 'UCI.py')):
+            parser.error(f'no engine/UCI.py in {spec.directory}')
+    # as full FENs, EPD operations dropped, for the engines' position commands, each opening once
+    openings = []
+    for line in FEN.iter_lines(args.openings):
+        try:
+            board = Board(fen=line)
+            board.validate()
+        except (ValueError, IndexError, KeyError) as error:
+            parser.error(f'not a position in {args.openings}: {line} ({error})')
+        openings.append(board.to_fen())
+    openings = list(dict.fromkeys(openings))
+    if not openings:
+        parser.error(f'no positions in {args.openings}')
+    if args.games > 2 * len(openings):
+        print(f'{len(openings)} distinct openings, playing {2 * len(openings)} games rather than {args.games}',
+              file=sys.stderr)
+
+    run(new_spec, base_spec, openings, args.games, args.workers, tc, args.max_plies, args.material,
+        args.material_plies, args.elo0, args.elo1, args.alpha, args.beta, args.pgn)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Lazy SMP: N worker processes all search the same position at once, sharing one transposition table in shared memory.
+Nothing is split up explicitly. Workers help each other by filling the table, so each one finds cutoffs and move
+ordering that another has already paid for. Half of the workers search one ply ahead of the rest, which spreads them
+over more of the tree.
+
+Workers are started once and kept for every search, so a search doesn't pay for process start up. The first worker
+to finish its last iteration stops the rest, and the answer is the deepest finished iteration any worker reached.
+
+Run from the project root to measure the speed-up over a single process searching to the same depth:
+    python -m engine.ParallelSearch --workers 8 --depth 5
+There is only a speed-up to be had with a core per worker: on fewer, the workers just take turns on the CPU.
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+
+from model import Conversions
+from model.Board import Board
+from engine import Perft
+from engine.Search import Search, MAX_PLY
+from engine.TranspositionTable import TranspositionTable
+
+BENCH_POSITIONS = tuple(fen for _, fen, _ in Perft.SUITE)
+
+
+class _WorkerSearch(Search):
+
+    def __init__(self, board, table, stop_event):
+        super(_WorkerSearch, self).__init__(board, table)
+        self.stop_event = stop_event
+
+    def check_limits(self):
+        if self.stop_event.is_set():
+            self.stopped = True
+        super(_WorkerSearch, self).check_limits()
+
+
+def _worker(worker_id, memory_name, megabytes, tasks, results, stop_event):
+    memory = shared_memory.SharedMemory(name=memory_name)
+    table = TranspositionTable(megabytes, buffer=memory.buf)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            board, generation, max_depth, time_limit, node_limit = task
+            # Search.search starts a new generation itself, so hand it the one before
+            table.generation = (generation - 1) & 63
+            search = _WorkerSearch(board, table, stop_event)
+            search.search(max_depth, time_limit, node_limit, depth_offset=worker_id & 1)
+            stop_event.set()
+            results.put((worker_id, search.depth, search.score, search.best_move, search.pv, search.nodes))
+    finally:
+        table.slots.release()
+        memory.close()
+
+
+class ParallelSearch:
+
+    def __init__(self, workers=None, megabytes=64):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.memory = shared_memory.SharedMemory(create=True, size=TranspositionTable.bytes_for(megabytes))
+        self.memory.buf[:] = bytes(self.memory.size)
+        # the parent's own view of the shared table, only looked at (e.g. for hashfull), never searched with
+        self.table = TranspositionTable(megabytes, buffer=self.memory.buf)
+        self.stop_event = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.task_queues = []
+        self.processes = []
+        for worker_id in range(self.workers):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_worker, daemon=True,
+                                              args=(worker_id, self.memory.name, megabytes, tasks, self.results,
+                                                    self.stop_event))
+            process.start()
+            self.task_queues.append(tasks)
+            self.processes.append(process)
+        self.generation = 0
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.pv = []
+        self.seconds = 0.0
+
+    def search(self, board, max_depth=MAX_PLY - 1, time_limit=None, node_limit=None):
+        """
+        Best move for board, searching with every worker. node_limit is shared out between the workers.
+        """
+        self.generation = (self.generation + 1) & 63
+        self.stop_event.clear()
+        start = time.perf_counter()
+        worker_nodes = node_limit // self.workers if node_limit else None
+        for tasks in self.task_queues:
+            tasks.put((board, self.generation, max_depth, time_limit, worker_nodes))
+
+        results = [self.results.get() for _ in range(self.workers)]
+        self.seconds = time.perf_counter() - start
+        # deepest finished iteration wins, and the main (unshifted) worker breaks ties
+        _, self.depth, self.score, best_move, self.pv, _ = max(results, key=lambda result: (result[1], -result[0]))
+        self.nodes = sum(result[5] for result in results)
+        return best_move
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        for tasks in self.task_queues:
+            tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.table.slots.release()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def bench(workers, depth, megabytes=64, positions=BENCH_POSITIONS, out=sys.stdout):
+    """
+    Time to depth for one process and for workers processes over positions. Returns the overall speed-up.
+    """
+    single_total, parallel_total = 0.0, 0.0
+    with ParallelSearch(workers, megabytes) as parallel:
+        for fen in positions:
+            search = Search(Board(fen=fen), TranspositionTable(megabytes))
+            start = time.perf_counter()
+            single_move = search.search(max_depth=depth)
+            single_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parallel_move = parallel.search(Board(fen=fen), max_depth=depth)
+            parallel_seconds = time.perf_counter() - start
+
+            single_total += single_seconds
+            parallel_total += parallel_seconds
+            print(f'{fen}\n    1 process  {single_seconds:7.2f}s  {search.nodes / single_seconds:9.0f} nps  '
+                  f'{Conversions.move_to_algebraic(single_move)}\n'
+                  f'  {workers:3} processes {parallel_seconds:7.2f}s  {parallel.nodes / parallel_seconds:9.0f} nps  '
+                  f'{Conversions.move_to_algebraic(parallel_move)}  speed-up {single_seconds / parallel_seconds:.2f}x',
+                  file=out)
+    speed_up = single_total / parallel_total
+    print(f'total: 1 process {single_total:.2f}s, {workers} processes {parallel_total:.2f}s, '
+          f'speed-up {speed_up:.2f}x', file=out)
+    return speed_up
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel search speed-up over a fixed set of positions.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--hash', type=float, default=64, help='megabytes of shared transposition table')
+    args = parser.parse_args(argv)
+    bench(args.workers, args.depth, args.hash)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
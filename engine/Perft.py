@@ -0,0 +1,130 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth. Comparing against published counts catches any
+change to move generation that breaks legality, and timing it gives one throughput number to track across releases.
+
+Run from the project root:
+    python -m engine.Perft                       # the standard suite at depth 4
+    python -m engine.Perft --depth 5 --only kiwipete
+    python -m engine.Perft --divide --fen 'r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1' --depth 3
+    python -m engine.Perft --hash 64            # hash perft, sharing counts between transpositions
+    python -m engine.Perft --report report.json # with move generation counters and timings
+"""
+import argparse
+import sys
+import time
+
+from model import Conversions, Instrumentation
+from model.Board import Board
+from engine.TranspositionTable import TranspositionTable, EXACT, VALUE_LIMIT
+
+# https://www.chessprogramming.org/Perft_Results. counts[i] is the node count at depth i + 1
+SUITE = (
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     (20, 400, 8902, 197281, 4865609, 119060324)),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     (48, 2039, 97862, 4085603, 193690690)),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     (14, 191, 2812, 43238, 674624, 11030083)),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     (6, 264, 9467, 422333, 15833292)),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     (44, 1486, 62379, 2103487, 89941194)),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     (46, 2079, 89890, 3894594, 164075551)),
+)
+
+
+def perft(board, depth, table=None):
+    """
+    Number of leaf nodes depth plies below board. The last ply is counted from the move list, not played.
+    With a TranspositionTable, subtrees reached again by another move order are counted once. Counts too big for a
+    table entry are just not cached.
+    """
+    if depth == 0:
+        return 1
+    if table is not None and depth > 1:
+        entry = table.probe(board.zobrist_key)
+        if entry and entry[1] == depth:
+            return entry[0]
+    moves = board.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1, table)
+        board.unmake_move()
+    if table is not None and nodes < VALUE_LIMIT:
+        table.store(board.zobrist_key, depth, nodes, EXACT)
+    return nodes
+
+
+def divide(board, depth):
+    """
+    Perft split by root move, as a dict of move -> nodes. Diffing this against a reference engine narrows a wrong
+    count down to the move that causes it.
+    """
+    counts = {}
+    for move in board.legal_moves():
+        board.make_move(move)
+        counts[move] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def run_suite(depth, only=None, hash_megabytes=0, out=sys.stdout):
+    """
+    Runs every suite position at depth (or its deepest known count, if shallower). Returns True if all counts match.
+    """
+    total_nodes, total_seconds, all_passed = 0, 0.0, True
+    for name, fen, counts in SUITE:
+        if only and name not in only:
+            continue
+        position_depth = min(depth, len(counts))
+        board = Board(fen=fen)
+        table = TranspositionTable(hash_megabytes) if hash_megabytes else None
+        with Instrumentation.span(f'perft {name}'):
+            start = time.perf_counter()
+            nodes = perft(board, position_depth, table)
+            seconds = time.perf_counter() - start
+        passed = nodes == counts[position_depth - 1]
+        all_passed = all_passed and passed
+        total_nodes += nodes
+        total_seconds += seconds
+        status = 'ok' if passed else f'FAIL expected {counts[position_depth - 1]}'
+        print(f'{name:<12} depth {position_depth}  nodes {nodes:>12}  {status}'
+              f'  {seconds:8.2f}s  {nodes / seconds:12.0f} nps', file=out)
+    if total_seconds:
+        print(f'{"total":<12}          nodes {total_nodes:>12}  {"ok" if all_passed else "FAIL"}'
+              f'  {total_seconds:8.2f}s  {total_nodes / total_seconds:12.0f} nps', file=out)
+    return all_passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft correctness and throughput suite.')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--only', nargs='*', help='suite positions to run, by name')
+    parser.add_argument('--divide', action='store_true', help='per root move counts for --fen')
+    parser.add_argument('--fen', help='position for --divide (defaults to the start position)')
+    parser.add_argument('--hash', type=float, default=0, help='megabytes of transposition table, 0 for none')
+    parser.add_argument('--report', help='write instrumentation counters and timings to this JSON file')
+    args = parser.parse_args(argv)
+    if args.report:
+        Instrumentation.enable()
+
+    if args.divide:
+        board = Board(fen=args.fen)
+        counts = divide(board, args.depth)
+        for move, nodes in sorted(counts.items(), key=lambda item: Conversions.move_to_algebraic(item[0])):
+            print(f'{Conversions.move_to_algebraic(move)}: {nodes}')
+        print(f'\nmoves {len(counts)}  nodes {sum(counts.values())}')
+        return 0
+
+    passed = run_suite(args.depth, args.only, args.hash)
+    if args.report:
+        Instrumentation.dump_json(args.report)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
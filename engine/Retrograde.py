@@ -0,0 +1,332 @@
+"""
+Builds endgame tablebases (see model/Tablebase) by retrograde analysis:
+
+    python -m engine.Retrograde KQvK KRvK KPvK KBNvK --dir tablebases
+
+Every position of the material is scanned once for checkmates and for the moves that leave it (captures and
+promotions, whose results come from smaller tables, built first when missing). From the mates, results then spread
+backwards a ply at a time by unmaking moves: a position one move from a lost position is won, and a position all of
+whose moves reach won positions is lost. Whatever is left when nothing more changes is drawn. Working outwards a ply
+at a time means each result is found at its shortest distance to mate.
+
+Positions with castling or en passant rights are left out, as they can't come up in these endings.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+from model import Bitboard, Tablebase
+from model.Positions import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, PAWN_PUSHES, bishop_attacks, \
+    rook_attacks, queen_attacks
+from model.Streams import ordered_map
+
+PROMOTIONS = ('queen', 'rook', 'bishop', 'knight')
+# floors[] value for a position with a move out of the table that doesn't lose, so it can never be lost
+NEVER = 255
+
+SQUARE_BITS = Bitboard.SQUARE_BITS
+
+
+def _attacks(kind, white, square, occupied):
+    if kind == 'knight':
+        return KNIGHT_ATTACKS[square]
+    if kind == 'king':
+        return KING_ATTACKS[square]
+    if kind == 'pawn':
+        return PAWN_ATTACKS[white][square]
+    if kind == 'bishop':
+        return bishop_attacks(square, occupied)
+    if kind == 'rook':
+        return rook_attacks(square, occupied)
+    return queen_attacks(square, occupied)
+
+
+def _attacked(pieces, squares, target, by_white, occupied, captured=None):
+    for index, (white, kind) in enumerate(pieces):
+        if white == by_white and index != captured and _attacks(kind, white, squares[index], occupied) >> target & 1:
+            return True
+    return False
+
+
+def _kings(pieces):
+    return {white: pieces.index((white, 'king')) for white in (True, False)}
+
+
+def legal_position(pieces, squares, white_to_move):
+    if len(set(squares)) != len(squares):
+        return False
+    for (white, kind), square in zip(pieces, squares):
+        if kind == 'pawn' and square >> 3 in (0, 7):
+            return False
+    occupied = 0
+    for square in squares:
+        occupied |= SQUARE_BITS[square]
+    # the side that just moved can't be left in check
+    return not _attacked(pieces, squares, squares[_kings(pieces)[not white_to_move]], white_to_move, occupied)
+
+
+def moves(pieces, squares, white_to_move, kings):
+    """
+    Yields (leaves, pieces, squares) after each legal move, where leaves is True for a capture or promotion, whose
+    pieces are then a new list.
+    """
+    occupied = own = 0
+    for (white, _), square in zip(pieces, squares):
+        occupied |= SQUARE_BITS[square]
+        if white == white_to_move:
+            own |= SQUARE_BITS[square]
+    enemy = occupied & ~own
+    king = kings[white_to_move]
+
+    for index, (white, kind) in enumerate(pieces):
+        if white != white_to_move:
+            continue
+        origin = squares[index]
+        if kind == 'pawn':
+            targets = []
+            for rank, file in PAWN_PUSHES[white][origin]:
+                push = rank * 8 + file
+                if occupied >> push & 1:
+                    break
+                targets.append(push)
+            targets.extend(Bitboard.squares(PAWN_ATTACKS[white][origin] & enemy))
+        else:
+            targets = Bitboard.squares(_attacks(kind, white, origin, occupied) & ~own)
+
+        for target in targets:
+            after = list(squares)
+            after[index] = target
+            captured = squares.index(target) if enemy >> target & 1 else None
+            after_occupied = occupied & ~SQUARE_BITS[origin] | SQUARE_BITS[target]
+            if _attacked(pieces, after, after[king], not white_to_move, after_occupied, captured):
+                continue
+            promotes = kind == 'pawn' and target >> 3 in (0, 7)
+            if captured is None and not promotes:
+                yield False, pieces, after
+                continue
+            for promotion in PROMOTIONS if promotes else (kind,):
+                changed = [(white, promotion) if i == index else piece for i, piece in enumerate(pieces)]
+                if captured is None:
+                    yield True, changed, after
+                else:
+                    yield True, changed[:captured] + changed[captured + 1:], after[:captured] + after[captured + 1:]
+
+
+def unmoves(pieces, squares, white_to_move, kings):
+    """
+    Yields the squares of every legal position one quiet move (not a capture or promotion) before this one, with the
+    other side to move.
+    """
+    mover = not white_to_move
+    occupied = 0
+    for square in squares:
+        occupied |= SQUARE_BITS[square]
+    for index, (white, kind) in enumerate(pieces):
+        if white != mover:
+            continue
+        origin = squares[index]
+        if kind == 'pawn':
+            step = 8 if white else -8
+            sources = []
+            back = origin + step
+            if 1 <= back >> 3 <= 6 and not occupied >> back & 1:
+                sources.append(back)
+                # two squares from the starting rank, ignoring the en passant right it would have given
+                if origin >> 3 == (4 if white else 3) and not occupied >> (back + step) & 1:
+                    sources.append(back + step)
+        else:
+            sources = Bitboard.squares(_attacks(kind, white, origin, occupied) & ~occupied)
+        for source in sources:
+            before = list(squares)
+            before[index] = source
+            before_occupied = occupied & ~SQUARE_BITS[origin] | SQUARE_BITS[source]
+            if not _attacked(pieces, before, before[kings[white_to_move]], mover, before_occupied):
+                yield before
+
+
+class _Scanner:
+    """
+    Scans positions of a table for mates and moves that leave it. Module level state so worker processes keep it.
+    """
+    table = None
+    tablebases = None
+    kings = None
+
+
+def _start_scanner(name, directory):
+    _Scanner.table = Tablebase.Table(name)
+    _Scanner.tablebases = Tablebase.Tablebases(directory)
+    _Scanner.kings = _kings(_Scanner.table.pieces)
+
+
+def _scan(slot):
+    """
+    Scans the positions with the white king in slot, returning (mated, wins, floors): the positions that are
+    checkmate, (index, plies) for positions won in plies by a move leaving the table, and (index, floor) for
+    positions with moves leaving it but none winning. floor is the fewest plies such a position could be lost in,
+    NEVER if a move leaving it draws, and is negative when every move leaves the table, so it is lost in exactly
+    that many plies.
+    """
+    table, tablebases, kings = _Scanner.table, _Scanner.tablebases, _Scanner.kings
+    pieces = table.pieces
+    per_slot = table.half // len(table.king_squares)
+    mated, wins, floors = [], [], []
+    for white_to_move in (True, False):
+        start = slot * per_slot + (0 if white_to_move else table.half)
+        for index in range(start, start + per_slot):
+            squares, _ = table.position(index)
+            if not legal_position(pieces, squares, white_to_move) or table.canonical(squares) != squares:
+                continue
+            quiet = leaving = 0
+            best_win, floor = None, 0
+            for leaves, after_pieces, after in moves(pieces, squares, white_to_move, kings):
+                if not leaves:
+                    quiet += 1
+                    continue
+                leaving += 1
+                placed = [(white, kind, square) for (white, kind), square in zip(after_pieces, after)]
+                value = tablebases.lookup(placed, not white_to_move)
+                if value is None:
+                    raise LookupError(f'no table for {Tablebase.material_name(placed)[0]} in {tablebases.directory}')
+                result, plies = Tablebase.decode(value)
+                if result < 0:
+                    best_win = plies + 1 if best_win is None else min(best_win, plies + 1)
+                elif not result:
+                    floor = NEVER
+                elif floor != NEVER:
+                    floor = max(floor, plies + 1)
+            if not quiet and not leaving:
+                if _attacked(pieces, squares, squares[kings[white_to_move]], not white_to_move,
+                             sum(SQUARE_BITS[square] for square in squares)):
+                    mated.append(index)
+            elif best_win is not None:
+                wins.append((index, best_win))
+            elif floor:
+                floors.append((index, floor if quiet or floor == NEVER else -floor))
+    return mated, wins, floors
+
+
+def _lost(table, values, floors, rechecks, index, plies, kings):
+    """
+    Whether the position at index is lost in plies, every quiet move reaching a position already won for the other
+    side. One that would be, but for a move leaving the table that loses more slowly, is looked at again then.
+    """
+    floor = floors[index]
+    if floor == NEVER:
+        return False
+    squares, white_to_move = table.position(index)
+    for leaves, _, after in moves(table.pieces, squares, white_to_move, kings):
+        if not leaves and not 0 < values[table.index(after, not white_to_move)] < Tablebase.LOSS:
+            return False
+    if floor > plies:
+        rechecks[floor].append(index)
+        return False
+    return True
+
+
+def children(name):
+    """
+    The material balances that a capture, a promotion or both lead to from name.
+    """
+    pieces = Tablebase.Table(name).pieces
+    variants = [pieces] + [[(white, promotion) if i == index else piece for i, piece in enumerate(pieces)]
+                           for index, (white, kind) in enumerate(pieces) if kind == 'pawn' for promotion in PROMOTIONS]
+    names = {Tablebase.material_name(variant)[0] for variant in variants[1:]}
+    for variant in variants:
+        for captured, (_, kind) in enumerate(variant):
+            if kind != 'king':
+                names.add(Tablebase.material_name(variant[:captured] + variant[captured + 1:])[0])
+    return sorted(names)
+
+
+def path(directory, name):
+    return os.path.join(directory, name + Tablebase.EXTENSION)
+
+
+def generate(name, directory, workers=None, log=None):
+    """
+    Writes name's table to directory, first building any missing tables that its captures and promotions lead to.
+    The scan is spread over workers processes (None for one per CPU, 0 for none). Returns the table's path.
+    """
+    table = Tablebase.Table(name)
+    os.makedirs(directory, exist_ok=True)
+    for child in children(name):
+        if child not in Tablebase.DRAWN and not os.path.exists(path(directory, child)):
+            generate(child, directory, workers, log)
+
+    start = time.perf_counter()
+    pieces, kings = table.pieces, _kings(table.pieces)
+    values = bytearray(table.size)
+    floors = bytearray(table.size)
+    # positions decided by moves leaving the table, by the plies they're decided at: wins, and losses to look at
+    wins, rechecks = defaultdict(list), defaultdict(list)
+    current = []
+    for mated, slot_wins, slot_floors in ordered_map(_scan, range(len(table.king_squares)), workers=workers,
+                                                     chunk_size=1, initializer=_start_scanner,
+                                                     initargs=(name, directory)):
+        for index in mated:
+            values[index] = Tablebase.encode(-1, 0)
+            current.append(index)
+        for index, plies in slot_wins:
+            floors[index] = NEVER
+            wins[plies].append(index)
+        for index, floor in slot_floors:
+            floors[index] = abs(floor)
+            if floor < 0:
+                rechecks[-floor].append(index)
+
+    plies = 0
+    while current or wins or rechecks:
+        following = []
+        for index in current:
+            squares, white_to_move = table.position(index)
+            for before in unmoves(pieces, squares, white_to_move, kings):
+                previous = table.index(before, not white_to_move)
+                if values[previous]:
+                    continue
+                # an even distance is a loss for the side to move, so the move into it wins
+                if not plies % 2 or _lost(table, values, floors, rechecks, previous, plies + 1, kings):
+                    values[previous] = Tablebase.encode(-1 if plies % 2 else 1, plies + 1)
+                    following.append(previous)
+        plies += 1
+        for index in wins.pop(plies, ()):
+            if not values[index]:
+                values[index] = Tablebase.encode(1, plies)
+                following.append(index)
+        for index in rechecks.pop(plies, ()):
+            if not values[index] and _lost(table, values, floors, rechecks, index, plies, kings):
+                values[index] = Tablebase.encode(-1, plies)
+                following.append(index)
+        current = following
+
+    written = path(directory, name)
+    with open(written + '.part', 'wb') as out:
+        out.write(values)
+    os.replace(written + '.part', written)
+    if log:
+        longest = max((value for value in values[:table.half] if value < Tablebase.LOSS), default=0)
+        log(f'{name}: {table.size} positions, longest mate {longest} moves for white, '
+            f'{time.perf_counter() - start:.1f}s')
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Builds endgame tablebases by retrograde analysis.')
+    parser.add_argument('materials', nargs='+', help='material balances, e.g. KQvK KRvKP')
+    parser.add_argument('--dir', default='tablebases', help='where to write tables (default tablebases)')
+    parser.add_argument('--workers', type=int, help='processes to scan with (default one per CPU, 0 for none)')
+    args = parser.parse_args(argv)
+
+    for name in args.materials:
+        try:
+            generate(name, args.dir, args.workers, log=print)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
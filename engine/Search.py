@@ -0,0 +1,318 @@
+"""
+Alpha-beta search over Board.
+
+    - negamax alpha-beta with a principal variation search (null window) for every move after the first
+    - iterative deepening: search depth 1, 2, 3... until the time or node budget runs out, keeping the best move of
+        the last finished iteration. Each iteration's best line is tried first by the next
+    - quiescence search on captures and promotions at the horizon, so a leaf is never scored in the middle of an
+        exchange
+    - move ordering: transposition table move, then captures by MVV-LVA (most valuable victim, least valuable
+        attacker), then the two killer moves for the ply, then quiet moves by history score
+    - draws by repetition, the fifty move rule and insufficient material are scored 0 as soon as they come up, a
+        single repetition being enough inside the search
+    - endgame tables, when Board.tablebases is set: positions they cover are scored exactly instead of searched
+
+Scores are centipawns from the side to move's point of view, mates are MATE minus the plies to mate.
+"""
+import time
+
+from model import Instrumentation
+from engine.TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE = 30000
+INFINITY = 32000
+# scores beyond this are mates, and are stored in the table relative to the node rather than the root
+MATE_BOUND = MATE - 1000
+
+MAX_PLY = 128
+
+# how deep a forced move (the only legal one) is searched: not worth the clock, but it still needs a score
+FORCED_MOVE_DEPTH = 4
+
+# nodes between checks of the clock
+CHECK_EVERY = 1024
+
+# ordering bands, tried highest first
+TABLE_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORES = (1 << 27, (1 << 27) - 1)
+
+_victim_values = {'pawn': 1, 'knight': 3, 'bishop': 3, 'rook': 5, 'queen': 9, 'king': 0}
+
+
+def mvv_lva(victim, attacker):
+    return _victim_values[victim] * 16 - _victim_values[attacker]
+
+
+class SearchStopped(Exception):
+    pass
+
+
+class Search:
+
+    def __init__(self, board, table=None):
+        self.board = board
+        self.table = table if table is not None else TranspositionTable()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        # history[white][from square][to square], raised when a quiet move causes a beta cutoff
+        self.history = {white: [[0] * 64 for _ in range(64)] for white in (True, False)}
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = None
+        self.node_limit = None
+        self.best_move = None
+        self.score = 0
+        self.pv = []
+        self.depth = 0
+
+    def stop(self):
+        """
+        Asks a running search (e.g. on another thread) to stop. It returns the best move found so far.
+        """
+        self.stopped = True
+
+    def search(self, max_depth=MAX_PLY - 1, time_limit=None, node_limit=None, info=None, depth_offset=0):
+        """
+        Iteratively deepens up to max_depth, or until time_limit seconds or node_limit nodes have passed.
+        info, if given, is called after every finished iteration with (depth, score, nodes, seconds, pv).
+        depth_offset makes every iteration that much deeper, max_depth included, so that helpers in a parallel
+        search work one ply ahead of the rest rather than on the same depth.
+        Returns the best move, or None if there are no legal moves.
+        """
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit else None
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.table.new_search()
+        root_moves = self.board.legal_moves()
+        self.best_move = root_moves[0] if root_moves else None
+        self.score, self.pv, self.depth = 0, [], 0
+        if not root_moves:
+            self.stopped = False
+            return None
+        if len(root_moves) == 1:
+            max_depth = min(max_depth, FORCED_MOVE_DEPTH)
+        answer = None
+        if self.board.tablebases is not None and self.board.probe_tablebase() is not None:
+            answer = tablebase_move(self.board, root_moves)
+        if answer:
+            self.best_move, self.score = answer
+            self.pv, self.depth = [self.best_move], 1
+            if info:
+                info(1, self.score, self.nodes, time.perf_counter() - start, self.pv)
+            self.stopped = False
+            return self.best_move
+
+        undo_depth = len(self.board.undo_stack)
+        for depth in range(1 + depth_offset, min(max_depth + depth_offset, MAX_PLY - 1) + 1):
+            try:
+                score, pv = self.negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchStopped:
+                # unwind whatever the interrupted iteration had played
+                while len(self.board.undo_stack) > undo_depth:
+                    self.board.unmake_move()
+                break
+            self.score, self.pv, self.depth = score, pv, depth
+            if pv:
+                self.best_move = pv[0]
+            if info:
+                info(depth, score, self.nodes, time.perf_counter() - start, pv)
+            if abs(score) > MATE_BOUND and MATE - abs(score) <= depth:
+                break
+            # another iteration takes several times as long as this one did, so don't start what can't finish
+            if self.deadline and time.perf_counter() + (time.perf_counter() - start) * 2 > self.deadline:
+                break
+        # cleared here rather than at the start, so that a stop() that lands before the search begins isn't lost
+        self.stopped = False
+        return self.best_move
+
+    def check_limits(self):
+        if self.stopped or (self.node_limit and self.nodes >= self.node_limit) or \
+                (self.deadline and time.perf_counter() >= self.deadline):
+            self.stopped = True
+            raise SearchStopped()
+
+    def order_moves(self, moves, table_move, ply):
+        board = self.board.board
+        killers = self.killers[ply]
+        history = self.history[self.board.white_to_move]
+        en_passant = self.board.en_passant
+        scored = []
+        for move in moves:
+            from_square, to_square, promotion = move
+            if move == table_move:
+                score = TABLE_MOVE_SCORE
+            else:
+                victim = board[to_square >> 3][to_square & 7]
+                attacker = board[from_square >> 3][from_square & 7]
+                if victim:
+                    score = CAPTURE_SCORE + mvv_lva(victim.kind, attacker.kind)
+                elif promotion or (to_square == en_passant and attacker.kind == 'pawn'):
+                    score = CAPTURE_SCORE + (mvv_lva(promotion, 'pawn') if promotion else mvv_lva('pawn', 'pawn'))
+                elif move == killers[0]:
+                    score = KILLER_SCORES[0]
+                elif move == killers[1]:
+                    score = KILLER_SCORES[1]
+                else:
+                    score = history[from_square][to_square]
+            scored.append((score, move))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [move for _, move in scored]
+
+    def is_tactical(self, move):
+        from_square, to_square, promotion = move
+        board = self.board
+        if promotion or board.board[to_square >> 3][to_square & 7]:
+            return True
+        return to_square == board.en_passant and board.board[from_square >> 3][from_square & 7].kind == 'pawn'
+
+    def negamax(self, depth, alpha, beta, ply):
+        """
+        (score, principal variation) for the side to move, searching depth plies and then quiescence.
+        """
+        board = self.board
+        # a position repeated inside the search is scored as the draw it could be made into
+        if ply and (board.fifty_move_count >= 100 or board.is_repetition() or board.has_insufficient_material()):
+            return 0, []
+        if ply >= MAX_PLY - 1:
+            return board.evaluate(), []
+        if ply and board.tablebases is not None:
+            probed = board.probe_tablebase()
+            if probed is not None:
+                return tablebase_score(probed, ply), []
+
+        in_check = board.in_check()
+        if in_check:
+            # don't let the horizon hide a mate behind a check
+            depth += 1
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply), []
+
+        self.nodes += 1
+        if not self.nodes % CHECK_EVERY:
+            self.check_limits()
+
+        key = board.zobrist_key
+        entry = self.table.probe(key)
+        table_move = None
+        if entry:
+            value, entry_depth, bound, table_move = entry
+            if ply and entry_depth >= depth:
+                value = self.from_table(value, ply)
+                if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+                    return value, [table_move] if table_move else []
+
+        moves = board.legal_moves()
+        if not moves:
+            return (-MATE + ply if in_check else 0), []
+
+        original_alpha = alpha
+        best_score, best_move, best_pv = -INFINITY, None, []
+        for index, move in enumerate(self.order_moves(moves, table_move, ply)):
+            board.make_move(move)
+            if index == 0:
+                score, pv = self.negamax(depth - 1, -beta, -alpha, ply + 1)
+                score = -score
+            else:
+                score, pv = self.negamax(depth - 1, -alpha - 1, -alpha, ply + 1)
+                score = -score
+                if alpha < score < beta:
+                    score, pv = self.negamax(depth - 1, -beta, -alpha, ply + 1)
+                    score = -score
+            board.unmake_move()
+
+            if score > best_score:
+                best_score, best_move, best_pv = score, move, [move] + pv
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not self.is_tactical(move):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[0], killers[1] = move, killers[0]
+                    self.history[board.white_to_move][move[0]][move[1]] += depth * depth
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, self.to_table(best_score, ply), bound, best_move)
+        return best_score, best_pv
+
+    def quiescence(self, alpha, beta, ply):
+        board = self.board
+        self.nodes += 1
+        if not self.nodes % CHECK_EVERY:
+            self.check_limits()
+
+        stand_pat = board.evaluate()
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = [move for move in board.legal_moves() if self.is_tactical(move)]
+        for move in self.order_moves(captures, None, ply):
+            board.make_move(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    @staticmethod
+    def to_table(score, ply):
+        # mates are stored as distance from this node, so they stay right when reached at another ply
+        if score > MATE_BOUND:
+            return score + ply
+        if score < -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def from_table(score, ply):
+        if score > MATE_BOUND:
+            return score - ply
+        if score < -MATE_BOUND:
+            return score + ply
+        return score
+
+
+def tablebase_score(probed, ply):
+    result, plies = probed
+    return result * (MATE - ply - plies) if result else 0
+
+
+def tablebase_move(board, moves):
+    """
+    (move, score) for the move the endgame tables rate best, for a position they cover: the quickest mate, or else
+    the slowest loss. None when a move leads somewhere the tables don't cover (e.g. an under-promotion into material
+    without a table), since that move can't be compared with the rest.
+    """
+    scored = []
+    for move in moves:
+        board.make_move(move)
+        probed = board.probe_tablebase()
+        board.unmake_move()
+        if probed is None:
+            return None
+        scored.append((-tablebase_score(probed, 1), move))
+    score, move = max(scored, key=lambda pair: pair[0])
+    return move, score
+
+
+def best_move(board, max_depth=MAX_PLY - 1, time_limit=None, node_limit=None, table=None):
+    """
+    Convenience wrapper: the best move for board within the given budget.
+    """
+    return Search(board, table).search(max_depth, time_limit, node_limit)
+
+
+Instrumentation.register(Search, 'negamax', 'nodes searched')
+Instrumentation.register(Search, 'quiescence', 'quiescence nodes')
+Instrumentation.register(Search, 'search', 'searches', timed=True)
@@ -0,0 +1,398 @@
+"""
+A game server: many concurrent games, each a Board, played over JSON lines on a local socket or on stdin/stdout.
+
+    python -m engine.Server --port 8765 --live-games 1000 --store games
+    python -m engine.Server --stdio
+    python -m engine.Server bench --games 2000 --clients 20 --live-games 500
+
+Every request is one JSON object on a line, answered by one line carrying the same id:
+    {"id": 1, "op": "new"}                                   -> {"id": 1, "ok": true, "game": "...", "fen": "..."}
+    {"id": 2, "op": "move", "game": "...", "from": "e2", "to": "e4"}
+                                                             -> {"id": 2, "ok": true, "fen": "...", "status": "playing"}
+The ops are new (with an optional fen), move (with an optional promotion, queen by default), moves (the legal moves,
+in coordinate notation), state, close (forgets the game) and stats. A request that can't be done is answered with
+{"id", "ok": false, "error"}. status is one of playing, checkmate, stalemate or draw.
+
+Only the live_games most recently used boards are kept in memory. The least recently used one is evicted to the store
+directory as its starting position (a 40 byte Encoding record) followed by its moves (2 bytes each), and is replayed
+from there the next time it's asked for, so its repetition history comes back with it. Live games are saved the same
+way on shutdown, so a restarted server picks them up again.
+
+Everything runs on one asyncio event loop. A move takes well under a millisecond, so rather than a thread per
+connection, each connection's requests are answered in order while other connections' interleave with them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+from array import array
+from collections import OrderedDict, defaultdict
+
+from model import Conversions, Encoding
+from model.Board import Board
+from engine.TranspositionTable import encode_move, decode_move
+
+DEFAULT_PORT = 8765
+DEFAULT_LIVE_GAMES = 1000
+DEFAULT_STORE = 'games'
+EXTENSION = '.game'
+
+_GAME_ID = re.compile(r'[0-9a-f]{32}')
+_SQUARE = re.compile(r'[a-h][1-8]')
+
+
+class Latency:
+    """
+    Request latencies per op, counted in power of two microsecond buckets so memory stays fixed however many
+    requests there are. Percentiles are the upper edge of the bucket they fall in.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = defaultdict(lambda: [0] * self.BUCKETS)
+        self.totals = defaultdict(float)
+
+    def record(self, op, seconds):
+        micros = int(seconds * 1000000)
+        self.buckets[op][min(micros.bit_length(), self.BUCKETS - 1)] += 1
+        self.totals[op] += seconds
+
+    @staticmethod
+    def _percentile(buckets, count, fraction):
+        seen = 0
+        for bucket, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= count * fraction:
+                return 1 << bucket
+        return 1 << (len(buckets) - 1)
+
+    def summary(self):
+        """
+        {op: {count, mean_us, p50_us, p99_us, max_us}}
+        """
+        summary = {}
+        for op, buckets in self.buckets.items():
+            count = sum(buckets)
+            summary[op] = {
+                'count': count,
+                'mean_us': round(self.totals[op] / count * 1000000, 1),
+                'p50_us': self._percentile(buckets, count, 0.5),
+                'p99_us': self._percentile(buckets, count, 0.99),
+                'max_us': 1 << max(bucket for bucket, bucket_count in enumerate(buckets) if bucket_count),
+            }
+        return summary
+
+
+class Sessions:
+    """
+    The games, by id: the live_games most recently used as Boards, the rest on disk in store.
+    """
+
+    def __init__(self, store=DEFAULT_STORE, live_games=DEFAULT_LIVE_GAMES):
+        self.store = store
+        self.live_games = max(1, live_games)
+        # game id -> (encoded starting position, board), least recently used first
+        self.live = OrderedDict()
+        self.evictions = self.restores = 0
+        os.makedirs(store, exist_ok=True)
+
+    def path(self, game):
+        return os.path.join(self.store, game + EXTENSION)
+
+    def create(self, board):
+        """
+        Registers board, which the caller has already validated, as a new game and returns its id.
+        """
+        game = uuid.uuid4().hex
+        self._add(game, Encoding.encode(board), board)
+        return game
+
+    def board(self, game):
+        """
+        The Board of game, restored from the store if it was evicted. LookupError if there's no such game.
+        """
+        if game in self.live:
+            self.live.move_to_end(game)
+            return self.live[game][1]
+        if not isinstance(game, str) or not _GAME_ID.fullmatch(game) or not os.path.exists(self.path(game)):
+            raise LookupError(f'no game {game}')
+        with open(self.path(game), 'rb') as file:
+            data = file.read()
+        start = data[:Encoding.RECORD_BYTES]
+        moves = array('H')
+        moves.frombytes(data[Encoding.RECORD_BYTES:])
+        board = Encoding.decode(start)
+        for code in moves:
+            board.make_move(decode_move(code))
+        self.restores += 1
+        self._add(game, start, board)
+        return board
+
+    def close(self, game):
+        self.board(game)
+        del self.live[game]
+        if os.path.exists(self.path(game)):
+            os.remove(self.path(game))
+
+    def _add(self, game, start, board):
+        self.live[game] = (start, board)
+        while len(self.live) > self.live_games:
+            self._save(*self.live.popitem(last=False))
+            self.evictions += 1
+
+    def _save(self, game, entry):
+        start, board = entry
+        # moves in the machine's byte order: the store belongs to this server
+        moves = array('H', (encode_move(undo[0]) for undo in board.undo_stack))
+        path = self.path(game)
+        with open(path + '.part', 'wb') as out:
+            out.write(start)
+            out.write(moves.tobytes())
+        os.replace(path + '.part', path)
+
+    def save_all(self):
+        for game, entry in self.live.items():
+            self._save(game, entry)
+
+
+def status(board):
+    if not board.legal_moves():
+        return 'checkmate' if board.in_check() else 'stalemate'
+    return 'draw' if board.is_draw() else 'playing'
+
+
+class GameServer:
+    """
+    Answers requests against sessions, timing each one.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.latency = Latency()
+        self.started = time.perf_counter()
+
+    def respond(self, line):
+        """
+        The response line (without newline) for a request line.
+        """
+        start = time.perf_counter()
+        request_id, op = None, 'invalid'
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request is a JSON object')
+            request_id = request.get('id')
+            handler = self.OPS.get(request.get('op')) if isinstance(request.get('op'), str) else None
+            if handler is None:
+                raise ValueError(f'unknown op {request.get("op")!r}')
+            op = request['op']
+            response = handler(self, request)
+            response['ok'] = True
+        except KeyError as error:
+            response = {'ok': False, 'error': f'missing {error.args[0]!r}'}
+        except (ValueError, LookupError) as error:
+            response = {'ok': False, 'error': str(error)}
+        except TypeError:
+            response = {'ok': False, 'error': f'malformed {op} request'}
+        except Exception:
+            # a bug, not the client's doing: log it here and keep the details (and the connection) out of the reply
+            traceback.print_exc()
+            response = {'ok': False, 'error': 'internal error'}
+        response['id'] = request_id
+        text = json.dumps(response, separators=(',', ':'))
+        self.latency.record(op, time.perf_counter() - start)
+        return text
+
+    def new(self, request):
+        fen = request.get('fen')
+        if fen is not None and not isinstance(fen, str):
+            raise ValueError('fen must be a string')
+        # everything that can fail on a bad position runs before the game is registered, so none is left half made
+        try:
+            board = Board(fen=fen)
+            board.validate()
+            fen, state = board.to_fen(), status(board)
+        except ValueError as error:
+            raise ValueError(f'not a position: {error}')
+        except (IndexError, KeyError):
+            raise ValueError('not a position')
+        return {'game': self.sessions.create(board), 'fen': fen, 'status': state}
+
+    def move(self, request):
+        board = self.sessions.board(request['game'])
+        from_square, to_square = request['from'], request['to']
+        promotion = request.get('promotion', 'queen')
+        if not all(isinstance(square, str) and _SQUARE.fullmatch(square) for square in (from_square, to_square)) \
+                or promotion not in Conversions.promotion_letters:
+            raise ValueError('a move is from and to squares (e.g. e2, e4) and an optional promotion piece')
+        if not board.move_piece_external(from_square, to_square, promotion):
+            raise ValueError(f'illegal move {from_square}{to_square}')
+        return {'fen': board.to_fen(), 'status': status(board)}
+
+    def moves(self, request):
+        board = self.sessions.board(request['game'])
+        return {'moves': [Conversions.move_to_algebraic(move) for move in board.legal_moves()]}
+
+    def state(self, request):
+        board = self.sessions.board(request['game'])
+        return {'fen': board.to_fen(), 'status': status(board),
+                'moves': [Conversions.move_to_algebraic(undo[0]) for undo in board.undo_stack]}
+
+    def close(self, request):
+        self.sessions.close(request['game'])
+        return {}
+
+    def stats(self, request):
+        return {'live': len(self.sessions.live), 'evictions': self.sessions.evictions,
+                'restores': self.sessions.restores, 'uptime': round(time.perf_counter() - self.started, 1),
+                'latency': self.latency.summary()}
+
+    OPS = {'new': new, 'move': move, 'moves': moves, 'state': state, 'close': close, 'stats': stats}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.respond(line).encode() + b'\n')
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_stdio(self, lines=sys.stdin, out=sys.stdout):
+        loop = asyncio.get_running_loop()
+        while True:
+            # reading stdin blocks, so it waits on a thread and the loop stays free
+            line = await loop.run_in_executor(None, lines.readline)
+            if not line:
+                break
+            if line.strip():
+                out.write(self.respond(line) + '\n')
+                out.flush()
+
+
+async def serve(server, host, port, ready=None):
+    """
+    Serves on host:port until cancelled. ready, if given, is called with the port once listening.
+    """
+    listener = await asyncio.start_server(server.serve_connection, host, port)
+    if ready:
+        ready(listener.sockets[0].getsockname()[1])
+    async with listener:
+        await listener.serve_forever()
+
+
+async def _request(reader, writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def _client(host, port, games, moves, seed, timings):
+    """
+    Starts games games, then goes round them making a random legal move in each, for moves moves or until it ends.
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def timed(message):
+        start = time.perf_counter()
+        response = await _request(reader, writer, message)
+        timings[message['op']].append(time.perf_counter() - start)
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        return response
+
+    ids = [(await timed({'id': 0, 'op': 'new'}))['game'] for _ in range(games)]
+    playing = list(ids)
+    for _ in range(moves):
+        still_playing = []
+        for game in playing:
+            legal = (await timed({'id': 0, 'op': 'moves', 'game': game}))['moves']
+            move = rng.choice(legal)
+            message = {'id': 0, 'op': 'move', 'game': game, 'from': move[:2], 'to': move[2:4]}
+            if len(move) > 4:
+                message['promotion'] = Conversions.letters_to_promotion[move[4]]
+            if (await timed(message))['status'] == 'playing':
+                still_playing.append(game)
+        playing = still_playing
+    for game in ids:
+        await timed({'id': 0, 'op': 'close', 'game': game})
+    writer.close()
+
+
+async def bench(games, clients, moves, live_games, store, out=sys.stdout):
+    """
+    Plays games random games over clients connections to a server started in this process, and reports requests
+    per second and latency percentiles, as the clients saw them, per op.
+    """
+    server = GameServer(Sessions(store, live_games))
+    started = asyncio.get_running_loop().create_future()
+    serving = asyncio.ensure_future(serve(server, '127.0.0.1', 0, started.set_result))
+    port = await started
+    timings = defaultdict(list)
+    start = time.perf_counter()
+    shares = [games // clients + (index < games % clients) for index in range(clients)]
+    await asyncio.gather(*(_client('127.0.0.1', port, share, moves, index, timings)
+                           for index, share in enumerate(shares) if share))
+    seconds = time.perf_counter() - start
+    serving.cancel()
+
+    requests = sum(len(times) for times in timings.values())
+    print(f'{games} games over {clients} connections, {live_games} live: {requests} requests in {seconds:.2f}s, '
+          f'{requests / seconds:.0f} requests/s', file=out)
+    for op, times in sorted(timings.items()):
+        times.sort()
+        print(f'  {op:6} {len(times):7}  p50 {times[len(times) // 2] * 1000:7.2f}ms  '
+              f'p99 {times[int(len(times) * 0.99)] * 1000:7.2f}ms  max {times[-1] * 1000:7.2f}ms', file=out)
+    print(f'  evictions {server.sessions.evictions}, restores {server.sessions.restores}', file=out)
+    return requests / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serves concurrent games over JSON lines.')
+    parser.add_argument('command', nargs='?', choices=('serve', 'bench'), default='serve')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--stdio', action='store_true', help='serve stdin/stdout instead of a socket')
+    parser.add_argument('--live-games', type=int, default=DEFAULT_LIVE_GAMES, help='boards kept in memory')
+    parser.add_argument('--store', default=DEFAULT_STORE, help='directory evicted games are kept in (bench uses a '
+                                                               'temporary one)')
+    parser.add_argument('--games', type=int, default=2000, help='bench: games to play')
+    parser.add_argument('--clients', type=int, default=20, help='bench: connections to play them over')
+    parser.add_argument('--moves', type=int, default=40, help='bench: moves per game')
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        with tempfile.TemporaryDirectory() as store:
+            asyncio.run(bench(args.games, args.clients, args.moves, args.live_games, store))
+        return 0
+
+    server = GameServer(Sessions(args.store, args.live_games))
+    try:
+        if args.stdio:
+            asyncio.run(server.serve_stdio())
+        else:
+            print(f'serving on {args.host}:{args.port}', file=sys.stderr)
+            asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.sessions.save_all()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+A fixed size hash table keyed by Board.zobrist_key, for search results, perft counts or anything else worth
+remembering about a position. Its memory is set once, up front, and never grows: when two positions want the same
+slot, the one that is deeper and from the current search wins.
+
+Each entry is two 64 bit words, (key ^ data, data), where data packs:
+    bits  0-15  move: from square (6 bits), to square (6 bits), promotion (3 bits, 0 for none)
+    bits 16-23  depth
+    bits 24-25  bound: EXACT, LOWER or UPPER (0 marks an empty slot)
+    bits 26-31  age, the search generation the entry was written in
+    bits 32-63  value, a signed 32 bit integer
+Storing key ^ data means a torn write (two processes sharing one table through shared memory) just reads back as
+a miss rather than as another position's data.
+
+Slots come in pairs. A position may live in either slot of its pair, and a store evicts whichever of the two is
+worth less: older generations first, then shallower depth.
+"""
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+ENTRY_BYTES = 16
+VALUE_LIMIT = 1 << 31
+
+_PROMOTION_CODES = {None: 0, 'queen': 1, 'rook': 2, 'bishop': 3, 'knight': 4}
+_PROMOTIONS = {code: kind for kind, code in _PROMOTION_CODES.items()}
+
+
+def encode_move(move):
+    if move is None:
+        return 0
+    from_square, to_square, promotion = move
+    return from_square | to_square << 6 | _PROMOTION_CODES[promotion] << 12 | 1 << 15
+
+
+def decode_move(code):
+    if not code:
+        return None
+    return code & 63, code >> 6 & 63, _PROMOTIONS[code >> 12 & 7]
+
+
+def entries_for(megabytes):
+    """
+    The largest power of two number of entries that fits in megabytes.
+    """
+    entries = max(2, int(megabytes * 1024 * 1024) // ENTRY_BYTES)
+    return 1 << (entries.bit_length() - 1)
+
+
+class TranspositionTable:
+
+    def __init__(self, megabytes=16, buffer=None):
+        """
+        buffer, if given, is any writable buffer (e.g. a multiprocessing.shared_memory block) of at least
+        bytes_for(megabytes) bytes to use as storage instead of a private array. Only that much of it is used, as the
+        size of a shared memory block can come rounded up to a whole number of pages.
+        """
+        self.entries = entries_for(megabytes)
+        if buffer is not None:
+            self.slots = memoryview(buffer)[:self.entries * ENTRY_BYTES].cast('Q')
+        else:
+            self.slots = array('Q', bytes(self.entries * ENTRY_BYTES))
+        # index of the first slot of a pair, in words
+        self.mask = (self.entries - 1) & ~1
+        self.generation = 0
+
+    @staticmethod
+    def bytes_for(megabytes):
+        return entries_for(megabytes) * ENTRY_BYTES
+
+    def new_search(self):
+        """
+        Start a new generation, so entries from earlier searches become the first to be replaced.
+        """
+        self.generation = (self.generation + 1) & 63
+
+    def clear(self):
+        memoryview(self.slots).cast('B')[:] = bytes(len(self.slots) * 8)
+        self.generation = 0
+
+    def probe(self, key):
+        """
+        (value, depth, bound, move) stored for key, or None.
+        """
+        slots = self.slots
+        index = (key & self.mask) << 1
+        for word in (index, index + 2):
+            data = slots[word + 1]
+            if data and slots[word] ^ data == key:
+                return (data >> 32) - VALUE_LIMIT, data >> 16 & 255, data >> 24 & 3, decode_move(data & 0xFFFF)
+        return None
+
+    def store(self, key, depth, value, bound, move=None):
+        """
+        Stores for key, replacing the least valuable entry in its pair. Values must fit in a signed 32 bit integer.
+        """
+        slots = self.slots
+        generation = self.generation
+        index = (key & self.mask) << 1
+        victim, victim_worth = index, None
+        for word in (index, index + 2):
+            data = slots[word + 1]
+            if not data or slots[word] ^ data == key:
+                victim = word
+                if data and not move:
+                    # keep the best move we already had for this position
+                    move = decode_move(data & 0xFFFF)
+                break
+            # entries from this search are worth more than any from an older one, then deeper beats shallower
+            worth = (256 if data >> 26 & 63 == generation else 0) + (data >> 16 & 255)
+            if victim_worth is None or worth < victim_worth:
+                victim, victim_worth = word, worth
+        data = ((value + VALUE_LIMIT) << 32 | generation << 26 | bound << 24 | min(max(depth, 0), 255) << 16
+                | encode_move(move))
+        slots[victim] = key ^ data
+        slots[victim + 1] = data
+
+    def hashfull(self):
+        """
+        Per mille of sampled slots in use by the current search, as UCI reports it.
+        """
+        sample = min(1000, self.entries)
+        used = 0
+        for word in range(0, sample * 2, 2):
+            data = self.slots[word + 1]
+            if data and data >> 26 & 63 == self.generation:
+                used += 1
+        return used * 1000 // sample
@@ -0,0 +1,288 @@
+"""
+Universal Chess Interface front end, so GUIs and match runners can drive the engine over stdin/stdout:
+    python -m engine.UCI
+
+Searches run on a background thread, so stop, isready and the like are answered while one is in progress. The
+clock is split by allocate_time: an even share of what's left over the moves to go, plus most of the increment.
+go ponder searches without a clock until ponderhit, which gives the search what's left of its allocation, or stop.
+With a BookFile set, positions in the opening book are answered from it without searching, and with a
+TablebasePath (a directory of engine/Retrograde tables) endgames they cover are played from the tables.
+"""
+import random
+import sys
+import threading
+
+from model import Conversions, Tablebase
+from model.Board import Board
+from engine.Book import Book
+from engine.ParallelSearch import ParallelSearch
+from engine.Search import Search, MATE, MATE_BOUND, MAX_PLY
+from engine.TranspositionTable import TranspositionTable
+
+NAME = 'hackett123 chess'
+AUTHOR = 'hackett123'
+
+DEFAULT_HASH_MB = 16
+# when the GUI doesn't say how many moves are left until the next time control, plan for this many
+DEFAULT_MOVES_TO_GO = 30
+# kept back from every allocation for the GUI round trip
+OVERHEAD_MS = 50
+
+
+def allocate_time(time_left_ms, increment_ms=0, moves_to_go=None):
+    """
+    Seconds to spend on this move given our clock, never more than the clock less the overhead.
+    """
+    moves_to_go = moves_to_go or DEFAULT_MOVES_TO_GO
+    budget = time_left_ms / moves_to_go + increment_ms * 3 / 4
+    budget = min(budget, time_left_ms - OVERHEAD_MS)
+    return max(budget, 1) / 1000
+
+
+def format_score(score):
+    if score > MATE_BOUND:
+        return f'mate {(MATE - score + 1) // 2}'
+    if score < -MATE_BOUND:
+        return f'mate -{(MATE + score) // 2}'
+    return f'cp {score}'
+
+
+class UCIEngine:
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.table = TranspositionTable(self.hash_mb)
+        self.parallel = None
+        self.book = None
+        self.board = Board()
+        self.search = None
+        self.search_thread = None
+        # set by stop, for go infinite, which must not report a best move until told to stop
+        self.stop_requested = threading.Event()
+        # likewise for go ponder, which waits for ponderhit or stop. ponder_time_limit is the time the search gets
+        # once ponderhit puts it on the clock, and ponder_timer stops it when that runs out
+        self.pondering = False
+        self.ponder_over = threading.Event()
+        self.ponder_time_limit = None
+        self.ponder_timer = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def run(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line):
+                break
+        self.stop()
+        if self.parallel:
+            self.parallel.close()
+        if self.book:
+            self.book.close()
+
+    def handle(self, line):
+        """
+        Handles one command line. Returns False on quit.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 4096')
+            self.send('option name Threads type spin default 1 min 1 max 256')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self.stop()
+            self.table.clear()
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'position':
+            self.stop()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop()
+            self.go(args)
+        elif command == 'stop':
+            self.stop()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        text = ' '.join(args)
+        name, _, value = text.partition(' value ')
+        name = name.replace('name', '', 1).strip().lower()
+        if name == 'hash':
+            self.stop()
+            self.hash_mb = max(1, int(value))
+            self.table = TranspositionTable(self.hash_mb)
+        elif name == 'threads':
+            self.stop()
+            self.threads = max(1, int(value))
+            if self.parallel:
+                self.parallel.close()
+                self.parallel = None
+        elif name == 'bookfile':
+            if self.book:
+                self.book.close()
+                self.book = None
+            if value.strip() and value.strip() != '<empty>':
+                try:
+                    self.book = Book(value.strip())
+                except OSError as error:
+                    self.send(f'info string cannot open book {value.strip()}: {error}')
+        elif name == 'tablebasepath':
+            self.stop()
+            if Board.tablebases:
+                Board.tablebases.close()
+                Board.tablebases = None
+            if value.strip() and value.strip() != '<empty>':
+                try:
+                    Board.tablebases = Tablebase.Tablebases(value.strip())
+                except OSError as error:
+                    self.send(f'info string cannot open tablebases {value.strip()}: {error}')
+            # parallel workers pick the tables up when they start
+            if self.parallel:
+                self.parallel.close()
+                self.parallel = None
+
+    def set_position(self, args):
+        if 'moves' in args:
+            split = args.index('moves')
+            setup, moves = args[:split], args[split + 1:]
+        else:
+            setup, moves = args, []
+        try:
+            board = Board(fen=' '.join(setup[1:])) if setup and setup[0] == 'fen' else Board()
+            board.validate()
+        except (ValueError, IndexError, KeyError) as error:
+            # a GUI's mistake mustn't take the engine down, nor send the search after a captured king
+            self.send(f'info string not a position, keeping the last one: {error}')
+            return
+        for text in moves:
+            try:
+                move = Conversions.algebraic_to_move(text)
+            except (ValueError, IndexError, KeyError):
+                move = None
+            if move not in board.legal_moves():
+                self.send(f'info string illegal move {text}, ignoring the rest')
+                break
+            board.make_move(move)
+        self.board = board
+
+    def go(self, args):
+        if self.book and 'infinite' not in args and 'ponder' not in args:
+            move = self.book.choose(self.board, random)
+            if move:
+                self.send('info string book move')
+                self.send(f'bestmove {Conversions.move_to_algebraic(move)}')
+                return
+        options = {}
+        flags = {'infinite', 'ponder'}
+        index = 0
+        while index < len(args):
+            if args[index] in flags:
+                options[args[index]] = True
+                index += 1
+            elif args[index] == 'searchmoves':
+                break
+            else:
+                options[args[index]] = int(args[index + 1]) if index + 1 < len(args) else 0
+                index += 2
+
+        time_limit = None
+        if 'movetime' in options:
+            time_limit = max(options['movetime'] - OVERHEAD_MS, 1) / 1000
+        elif not options.get('infinite'):
+            clock, increment = ('wtime', 'winc') if self.board.white_to_move else ('btime', 'binc')
+            if clock in options:
+                time_limit = allocate_time(options[clock], options.get(increment, 0), options.get('movestogo'))
+        max_depth = options.get('depth', MAX_PLY - 1)
+        node_limit = options.get('nodes')
+        self.pondering = options.get('ponder', False)
+        self.ponder_over.clear()
+        if self.pondering:
+            # the clock only starts on ponderhit
+            self.ponder_time_limit, time_limit = time_limit, None
+
+        if self.threads > 1:
+            if not self.parallel:
+                self.parallel = ParallelSearch(self.threads, self.hash_mb)
+            self.search = self.parallel
+        else:
+            self.search = Search(self.board, self.table)
+        self.stop_requested.clear()
+        self.search_thread = threading.Thread(target=self.think, daemon=True,
+                                              args=(self.board, max_depth, time_limit, node_limit,
+                                                    options.get('infinite', False)))
+        self.search_thread.start()
+
+    def think(self, board, max_depth, time_limit, node_limit, infinite):
+        if self.search is self.parallel:
+            best = self.parallel.search(board, max_depth, time_limit, node_limit)
+            self.info(self.parallel.depth, self.parallel.score, self.parallel.nodes, self.parallel.seconds,
+                      self.parallel.pv)
+        else:
+            best = self.search.search(max_depth, time_limit, node_limit, info=self.info)
+        if infinite:
+            self.stop_requested.wait()
+        elif self.pondering:
+            self.ponder_over.wait()
+        self.send(f'bestmove {Conversions.move_to_algebraic(best) if best else "0000"}')
+
+    def info(self, depth, score, nodes, seconds, pv):
+        fields = [f'info depth {depth}', f'score {format_score(score)}', f'nodes {nodes}']
+        if seconds:
+            fields.append(f'nps {int(nodes / seconds)}')
+            fields.append(f'time {int(seconds * 1000)}')
+            fields.append(f'hashfull {self.search.table.hashfull()}')
+        if pv:
+            fields.append('pv ' + ' '.join(Conversions.move_to_algebraic(move) for move in pv))
+        self.send(' '.join(fields))
+
+    def ponderhit(self):
+        """
+        The opponent played the move pondered on: the search goes on, from now on against the clock.
+        """
+        if not self.pondering:
+            return
+        self.pondering = False
+        if self.ponder_time_limit and self.search_thread and self.search_thread.is_alive():
+            self.ponder_timer = threading.Timer(self.ponder_time_limit, self.search.stop)
+            self.ponder_timer.start()
+        self.ponder_over.set()
+
+    def stop(self):
+        """
+        Stops any running search and waits for it to report its best move.
+        """
+        if self.ponder_timer:
+            self.ponder_timer.cancel()
+            self.ponder_timer = None
+        self.stop_requested.set()
+        self.ponder_over.set()
+        if self.search_thread and self.search_thread.is_alive():
+            self.search.stop()
+            self.search_thread.join()
+        self.search_thread = None
+
+
+def main():
+    UCIEngine().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,11 +11,11 @@ def tests():
     board = Board(fen='r1b1k2r/ppppqNpp/2n2n2/4p3/2B1P3/8/PPPP1KPP/RNBQ3R w kq - 1 7')
     print(board)
     black_knight = board.piece_at('f6')
-    print(moves_ext(black_knight.legal_moves()))
+    print(moves_ext(black_knight.legal_moves(board, Conversions.algebraic_to_square('f6'))))
 
     #
     # board = Board()
-    # pawn = Pawn(white=True, rank='5', file='6', board=board)
+    # pawn = Pawn(white=True)
     # print(pawn)
 
 
@@ -0,0 +1,99 @@
+"""
+Vectorized evaluation of many positions at once with NumPy (which this module, unlike the rest of model, needs).
+
+Positions come in as an (N, 64) array of Encoding piece codes (0 empty, 1-6 white, 7-12 black) or as (N, 12, 64)
+bit-planes, one plane per code 1-12. Both are scored against one (13, 64) table folding together material and the
+piece-square tables of Evaluation, signed for white, so a whole batch is a single gather and sum.
+
+Scores are centipawns from white's side unless side to move is given, matching Evaluation.evaluate then.
+"""
+try:
+    import numpy as np
+except ImportError as error:
+    # only this module needs it, so nothing else in model stops working without it
+    raise ImportError('model.BatchEval needs NumPy, which is not installed (pip install numpy)') from error
+
+from model import Encoding, Evaluation
+
+# SCORES[code, square]: what a piece of that code on that square is worth to white
+SCORES = np.zeros((13, 64), dtype=np.int32)
+for (_white, _kind), _code in Encoding.PIECE_CODES.items():
+    for _square in range(64):
+        _value = Evaluation.centipawns[_kind] + Evaluation.piece_square(_white, _kind, _square)
+        SCORES[_code, _square] = _value if _white else -_value
+PLANE_SCORES = SCORES[1:]
+
+# FEN letter (as a byte) -> piece code, everything else 0
+_FEN_LOOKUP = np.zeros(256, dtype=np.uint8)
+for _notation, _code in Encoding.FEN_CODES.items():
+    _FEN_LOOKUP[ord(_notation)] = _code
+
+# digits become that many empty squares, slashes go
+_EXPAND = str.maketrans({**{str(count): '.' * count for count in range(1, 9)}, '/': None})
+
+_SQUARES = np.arange(64)
+
+
+def codes_from_boards(boards):
+    rows = [[Encoding.PIECE_CODES[piece.white, piece.kind] if piece else 0 for rank in board.board for piece in rank]
+            for board in boards]
+    return np.array(rows, dtype=np.uint8).reshape(-1, 64)
+
+
+def codes_from_fens(fens):
+    """
+    (codes, white to move) straight from FEN or EPD strings, without building any Board or Piece.
+    """
+    placements, white_to_move = [], []
+    for fen in fens:
+        fields = fen.split(None, 2)
+        placements.append(fields[0].translate(_EXPAND))
+        white_to_move.append(len(fields) < 2 or fields[1] == 'w')
+    data = np.frombuffer(''.join(placements).encode('ascii'), dtype=np.uint8)
+    return _FEN_LOOKUP[data].reshape(-1, 64), np.array(white_to_move, dtype=bool)
+
+
+def codes_from_records(records):
+    """
+    (codes, white to move) from Encoding records: a PositionStore, bytes of back to back records, or an
+    (N, 40) uint8 array.
+    """
+    if isinstance(records, Encoding.PositionStore):
+        records = records.view
+    data = np.frombuffer(records, dtype=np.uint8).reshape(-1, Encoding.RECORD_BYTES)
+    placement = data[:, :32]
+    codes = np.empty((len(data), 64), dtype=np.uint8)
+    codes[:, 0::2] = placement & 15
+    codes[:, 1::2] = placement >> 4
+    return codes, (data[:, 32] & 1).astype(bool)
+
+
+def planes_from_codes(codes):
+    """
+    (N, 64) codes -> (N, 12, 64) bit-planes, plane i holding the squares with code i + 1.
+    """
+    return codes[:, None, :] == np.arange(1, 13, dtype=np.uint8)[None, :, None]
+
+
+def _from_side(scores, white_to_move):
+    if white_to_move is None:
+        return scores
+    return np.where(white_to_move, scores, -scores)
+
+
+def evaluate_codes(codes, white_to_move=None):
+    return _from_side(SCORES[codes, _SQUARES].sum(axis=1), white_to_move)
+
+
+def evaluate_planes(planes, white_to_move=None):
+    return _from_side(np.einsum('nps,ps->n', planes.astype(np.int32), PLANE_SCORES), white_to_move)
+
+
+def evaluate_boards(boards):
+    boards = list(boards)
+    return evaluate_codes(codes_from_boards(boards), np.array([board.white_to_move for board in boards]))
+
+
+def evaluate_fens(fens):
+    codes, white_to_move = codes_from_fens(fens)
+    return evaluate_codes(codes, white_to_move)
@@ -0,0 +1,64 @@
+"""
+A bitboard is a set of squares packed into one 64 bit integer. Bit i is set when square i is in the set.
+Squares are numbered in the same order as our internal 2d representation, square = rank * 8 + file, so
+a8 is square 0, h8 is square 7, a1 is square 56 and h1 is square 63.
+"""
+
+KINDS = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+
+EMPTY = 0
+FULL = (1 << 64) - 1
+
+SQUARE_BITS = tuple(1 << square for square in range(64))
+
+FILE_A = sum(SQUARE_BITS[rank * 8] for rank in range(8))
+FILE_H = FILE_A << 7
+# internal ranks, so RANKS[0] is the eighth rank and RANKS[7] the first
+RANKS = tuple(0xFF << (8 * rank) for rank in range(8))
+# a1 is dark, and so is every square whose rank and file add up odd (counting ranks either way)
+DARK_SQUARES = sum(SQUARE_BITS[square] for square in range(64) if ((square >> 3) + (square & 7)) & 1)
+LIGHT_SQUARES = ((1 << 64) - 1) ^ DARK_SQUARES
+
+
+def square(rank, file):
+    return rank * 8 + file
+
+
+def rank_file(sq):
+    return sq >> 3, sq & 7
+
+
+def empty_bitboards():
+    """
+    One bitboard per color and kind, keyed the same way we key pieces: by white (a boolean) then kind.
+    """
+    return {True: dict.fromkeys(KINDS, EMPTY), False: dict.fromkeys(KINDS, EMPTY)}
+
+
+def lsb(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+def msb(bitboard):
+    return bitboard.bit_length() - 1
+
+
+def popcount(bitboard):
+    return bin(bitboard).count('1')
+
+
+def squares(bitboard):
+    """
+    Yields the squares in the set, lowest first.
+    """
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+def to_string(bitboard):
+    rows = []
+    for rank in range(8):
+        rows.append(' '.join('1' if bitboard >> (rank * 8 + file) & 1 else '.' for file in range(8)))
+    return '\n'.join(rows)
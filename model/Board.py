@@ -1,44 +1,119 @@
-from model import FEN, Conversions
-from model.Piece import Piece, Pawn, Rook, Knight, Bishop, Queen, King
+from array import array
+
+from model import FEN, Conversions, Bitboard, MoveGen, Zobrist, Evaluation, Instrumentation, Polyglot, Tablebase
+from model.Piece import pieces
+
+# castling moves are recorded as the king's move, the rook comes along: king to -> (rook from, rook to)
+castle_rook_moves = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+# pieces whose attacks depend on what stands in their way
+sliding_kinds = frozenset(('bishop', 'rook', 'queen'))
+
+# attack bitboard -> its squares, for the attack map updates. only a few thousand distinct ones turn up in practice
+_target_squares = {}
+
+# pending squares past which make_move brings the attack maps up to date itself. a catch up never redoes more than
+# the 64 squares, so without the cap a game played or replayed with nobody reading the maps only grows the list
+PENDING_LIMIT = 64
+
+# plies of history room a board starts with. the history array doubles when it fills
+HISTORY_CAPACITY = 512
+
+# a piece leaving or landing on one of these squares (the king or a rook's home) loses that castling right
+castle_rights_lost_at = {
+    60: ('white_castles_king', 'white_castles_queen'),
+    63: ('white_castles_king',),
+    56: ('white_castles_queen',),
+    4: ('black_castles_king', 'black_castles_queen'),
+    7: ('black_castles_king',),
+    0: ('black_castles_queen',),
+}
 
 
 class Board:
 
+    # when set, every evaluate() is checked against a full recompute
+    debug_evaluation = False
+
+    # endgame tables for probe_tablebase, shared by every board, e.g. Board.tablebases = Tablebase.Tablebases(path)
+    tablebases = None
+
     def __init__(self, fen=None):
+        """
+        fen is a FEN (or EPD) string, or an already parsed FEN.FenRecord. Defaults to the start position.
+        """
         self.start_fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
         if not fen:
             fen = self.start_fen
+        record = fen if isinstance(fen, FEN.FenRecord) else FEN.parse_fen(fen)
 
-        self.board_as_string = FEN.read_fen(fen)
+        self.board_as_string = record.placement
+
+        # bitboards per color and kind, plus occupancy masks (and of the sliders, for the attack maps). self.board is
+        # kept alongside as a mailbox so that square -> piece lookups stay a single index
+        self.bitboards = Bitboard.empty_bitboards()
+        self.occupancy = {True: Bitboard.EMPTY, False: Bitboard.EMPTY}
+        self.occupied = Bitboard.EMPTY
+        self.sliders = Bitboard.EMPTY
         self.board = self.init_pieces()
-        self.white_castles_king, self.white_castles_queen, self.black_castles_king, self.black_castles_queen = FEN.castle_info(
-            fen)
-        self.white_to_move = FEN.who_moves(fen)
-        self.fifty_move_count = FEN.plies_since_capture(fen)
-        self.move_number = FEN.move_number(fen)
+        (self.white_castles_king, self.white_castles_queen,
+         self.black_castles_king, self.black_castles_queen) = record.castling
+        self.white_to_move = record.white_to_move
+        self.en_passant = Conversions.algebraic_to_square(record.en_passant) if record.en_passant else None
+        self.fifty_move_count = record.halfmove_clock
+        self.move_number = record.fullmove_number
         self.ply_number = self.move_number * 2
 
+        # attack maps: _attacks_from[square] is the bitboard of squares the piece on square attacks, _attackers[square]
+        # the bitboard of pieces (of both colors) attacking square. set_piece and clear_square only note the squares
+        # they change in _pending, and attack_maps catches up incrementally from those when the maps are next read, or
+        # when make_move finds more than PENDING_LIMIT waiting
+        self._attacks_from = [Bitboard.EMPTY] * 64
+        self._attackers = [Bitboard.EMPTY] * 64
+        self._pending = []
+        # counts catch ups, so that unmake_move can tell whether its move's changes are still pending
+        self._catch_ups = 0
+        for square in Bitboard.squares(self.occupied):
+            piece = self.board[square >> 3][square & 7]
+            self._set_attacks(square, MoveGen.piece_attacks(piece.kind, piece.white, square, self.occupied))
+
+        # one entry per move made, popped by unmake_move. see make_move for the layout
+        self.undo_stack = []
+
+        # kept up to date by set_piece, clear_square and make_move, see Zobrist
+        self.zobrist_key = Zobrist.compute(self)
+
+        # the zobrist key of every position since the board was set up, this one last, for spotting repetitions
+        self.history = array('Q', bytes(8 * HISTORY_CAPACITY))
+        self.history[0] = self.zobrist_key
+        self.history_length = 1
+
+        # running evaluation terms per side, kept up to date by set_piece and clear_square
+        self.material = {white: Evaluation.material(self, white) for white in (True, False)}
+        self.positional = {white: Evaluation.positional(self, white) for white in (True, False)}
+
     def copy_board(self):
-        new_board = []
-        for rank in self.board:
-            new_rank = []
-            for piece in rank:
-                if piece:
-                    new_rank.append(piece.copy())
-                else:
-                    new_rank.append(None)
-            new_board.append(new_rank)
-        return new_board
+        # pieces are shared and immutable, so copying the mailbox only copies its ranks
+        return [list(rank) for rank in self.board]
+
+    def to_fen(self):
+        placement = [[str(piece) if piece else ' ' for piece in rank] for rank in self.board]
+        castling = (self.white_castles_king, self.white_castles_queen,
+                    self.black_castles_king, self.black_castles_queen)
+        en_passant = Conversions.square_to_algebraic(self.en_passant) if self.en_passant is not None else None
+        return FEN.write_fen(placement, self.white_to_move, castling, en_passant, self.fifty_move_count,
+                             self.move_number)
 
     def board_to_string(self):
+        squares = ['_'] * 64
+        for white, kinds in self.bitboards.items():
+            for kind, bitboard in kinds.items():
+                notation = FEN.kind_to_fen[kind].upper() if white else FEN.kind_to_fen[kind]
+                for square in Bitboard.squares(bitboard):
+                    squares[square] = notation
         str_rep = ''
-        for rank_contents in self.board:
-            for piece in rank_contents:
-                if piece:
-                    str_rep += str(piece) + ' '
-                else:
-                    str_rep += '_ '
-            str_rep += '\n'
+        for rank in range(8):
+            str_rep += ' '.join(squares[rank * 8:rank * 8 + 8]) + ' \n'
         return str_rep
         # return '\n'.join([' '.join(rank) for rank in self.board])
 
@@ -54,6 +129,7 @@ class Board:
         }
 
         board = []
+        bitboards = self.bitboards
 
         for rank_index in range(len(self.board_as_string)):
             rank_contents = self.board_as_string[rank_index]
@@ -63,25 +139,180 @@ class Board:
                 if not piece == ' ':
                     white = str.isupper(piece)
                     kind = fen_to_pieces[str.lower(piece)]
-                    if kind == 'pawn':
-                        rank.append(Pawn(white, rank_index, file_index, self))
-                    elif kind == 'rook':
-                        rank.append(Rook(white, rank_index, file_index, self))
-                    elif kind == 'knight':
-                        rank.append(Knight(white, rank_index, file_index, self))
-                    elif kind == 'bishop':
-                        rank.append(Bishop(white, rank_index, file_index, self))
-                    elif kind == 'queen':
-                        rank.append(Queen(white, rank_index, file_index, self))
-                    elif kind == 'king':
-                        rank.append(King(white, rank_index, file_index, self))
+                    rank.append(pieces[white][kind])
+                    bit = Bitboard.SQUARE_BITS[rank_index * 8 + file_index]
+                    bitboards[white][kind] |= bit
+                    self.occupancy[white] |= bit
+                    self.occupied |= bit
+                    if kind in sliding_kinds:
+                        self.sliders |= bit
                 else:
                     rank.append(None)
             board.append(rank)
         return board
 
+    def legal_moves(self):
+        """
+        Every strictly legal move for the side to move, as (from square, to square, promotion) tuples. See MoveGen.
+        """
+        return MoveGen.legal_moves(self)
+
+    def polyglot_key(self):
+        """
+        The key opening books in Polyglot format use for this position. Unlike zobrist_key it's computed on demand.
+        """
+        return Polyglot.key(self)
+
+    def probe_tablebase(self):
+        """
+        (result, plies to mate) for the side to move from the endgame tables, result 1 for a win, 0 a draw and -1 a
+        loss. None without tables for the position, see Tablebase.Tablebases.probe.
+        """
+        if self.tablebases is None:
+            return None
+        return self.tablebases.probe(self)
+
+    def evaluate(self):
+        """
+        Material plus piece-square score in centipawns for the side to move, from the running totals.
+        """
+        score = self.material[True] + self.positional[True] - self.material[False] - self.positional[False]
+        if not self.white_to_move:
+            score = -score
+        if self.debug_evaluation:
+            assert score == Evaluation.evaluate(self), f'running evaluation {score} drifted from ' \
+                                                      f'{Evaluation.evaluate(self)} in {self.to_fen()}'
+        return score
+
+    def attack_maps(self):
+        """
+        The attackers map, a list giving for each square the bitboard of pieces attacking it, brought up to date.
+
+        Only what changed since the last call is redone: the pieces on squares filled or emptied since, and the
+        sliders that reached those squares, as a slider's attacks only change when a square it attacks does. A move
+        made and taken back before anything asks costs nothing here at all.
+        """
+        pending = self._pending
+        if pending:
+            attackers, sliders = self._attackers, self.sliders
+            stale = set(pending)
+            for square in pending:
+                reached = attackers[square] & sliders
+                while reached:
+                    low = reached & -reached
+                    reached ^= low
+                    stale.add(low.bit_length() - 1)
+            board, occupied = self.board, self.occupied
+            for square in stale:
+                piece = board[square >> 3][square & 7]
+                self._set_attacks(square, MoveGen.piece_attacks(piece.kind, piece.white, square, occupied)
+                                  if piece else Bitboard.EMPTY)
+            pending.clear()
+            self._catch_ups += 1
+        return self._attackers
+
+    def attackers_of(self, square, by_white=None):
+        """
+        Bitboard of the pieces attacking square, only by_white's if given. A lookup in the attack maps, after
+        catching them up with whatever moved since they were last read.
+        """
+        if by_white is None:
+            return self.attack_maps()[square]
+        return self.attack_maps()[square] & self.occupancy[by_white]
+
+    def is_square_attacked(self, square, by_white):
+        return bool(self.attack_maps()[square] & self.occupancy[by_white])
+
+    def in_check(self):
+        """
+        Whether the side to move's king is attacked.
+        """
+        us = self.white_to_move
+        king = self.bitboards[us]['king']
+        square = (king & -king).bit_length() - 1
+        if self._pending:
+            # one square is cheaper to work out directly than bringing the maps up to date, as in search
+            return bool(MoveGen.attackers_to(self, square, not us, self.occupied))
+        return bool(self._attackers[square] & self.occupancy[not us])
+
+    def validate(self):
+        """
+        Raises ValueError if the position can't stand on a board: each side needs exactly one king, no pawn may be on
+        the first or last rank, the side that just moved can't be left in check, and an en passant square must be
+        empty, on the side to move's sixth rank and behind a pawn that just moved two squares. A FEN can say any of
+        these (FEN.parse_fen already rejects one that can't be read at all), and move generation assumes none of them.
+        """
+        for white in (True, False):
+            if Bitboard.popcount(self.bitboards[white]['king']) != 1:
+                raise ValueError(f'{"white" if white else "black"} needs exactly one king')
+        if (self.bitboards[True]['pawn'] | self.bitboards[False]['pawn']) & (Bitboard.RANKS[0] | Bitboard.RANKS[7]):
+            raise ValueError('a pawn is on the first or last rank')
+        them = not self.white_to_move
+        king = self.bitboards[them]['king']
+        if self.is_square_attacked((king & -king).bit_length() - 1, self.white_to_move):
+            raise ValueError(f'{"white" if them else "black"} is in check but not to move')
+        if self.en_passant is not None:
+            target, us = self.en_passant, self.white_to_move
+            # the pawn that moved two squares stands one rank nearer its own side than the square it passed over
+            captured = target + 8 if us else target - 8
+            if (target >> 3 != (2 if us else 5) or self.occupied & Bitboard.SQUARE_BITS[target]
+                    or not self.bitboards[them]['pawn'] & Bitboard.SQUARE_BITS[captured]):
+                raise ValueError(f'en passant square {Conversions.square_to_algebraic(target)} has no pawn that just '
+                                 f'moved two squares in front of it')
+
+    def repetitions(self):
+        """
+        How many times the current position has stood on the board, this time included. A capture or pawn move can
+        never be undone, so only the plies since the last one are looked at, and of those only every other one, with
+        the same side to move.
+        """
+        history, current = self.history, self.history_length - 1
+        key = history[current]
+        count = 1
+        for index in range(current - 4, max(current - self.fifty_move_count, 0) - 1, -2):
+            if history[index] == key:
+                count += 1
+        return count
+
+    def is_repetition(self, times=2):
+        """
+        Whether the current position has now stood on the board times times. Stops looking as soon as it has.
+        """
+        history, current = self.history, self.history_length - 1
+        key = history[current]
+        for index in range(current - 4, max(current - self.fifty_move_count, 0) - 1, -2):
+            if history[index] == key:
+                times -= 1
+                if times == 1:
+                    return True
+        return times <= 1
+
+    def has_insufficient_material(self):
+        """
+        Whether neither side could ever mate: bare kings, plus at most a single knight, or bishops all on squares of
+        one color.
+        """
+        white, black = self.bitboards[True], self.bitboards[False]
+        if white['pawn'] | black['pawn'] | white['rook'] | black['rook'] | white['queen'] | black['queen']:
+            return False
+        knights = white['knight'] | black['knight']
+        bishops = white['bishop'] | black['bishop']
+        if knights:
+            return not bishops and not knights & (knights - 1)
+        return not bishops & Bitboard.DARK_SQUARES or not bishops & Bitboard.LIGHT_SQUARES
+
+    def is_fifty_move_draw(self):
+        # a mate on the hundredth ply still stands
+        return self.fifty_move_count >= 100 and not (self.in_check() and not self.legal_moves())
+
+    def is_draw(self):
+        """
+        Whether the game is drawn by threefold repetition, the fifty move rule or insufficient material.
+        """
+        return self.has_insufficient_material() or self.is_fifty_move_draw() or self.repetitions() >= 3
+
     def is_occupied(self, rank, file):
-        return self.board[rank][file]
+        return self.occupied >> (rank * 8 + file) & 1
 
     # using our internal representation of 2d list
     def piece_at_internal(self, rank, file):
@@ -97,39 +328,164 @@ class Board:
     # knight moves...) Returns Boolean - true if moved However, note that the "external" notation is for recording
     # moves - our input comes from the move itself, and recording that move for our records is not part of this
     # functionality
-    def move_piece_external(self, old_square, new_square):
+    def move_piece_external(self, old_square, new_square, promotion='queen'):
         (from_rank, from_file) = Conversions.algebraic_to_internal(old_square)
         (to_rank, to_file) = Conversions.algebraic_to_internal(new_square)
-        print('moving from', from_rank, from_file)
-        print('moving to', to_rank, to_file)
-        if self.move_piece_internal(from_rank, from_file, to_rank, to_file):
-            self.ply_number += 1
-            if not (self.ply_number % 2): self.move_number += 1
-
-    def move_piece_internal(self, from_rank, from_file, to_rank, to_file):
-        # verify piece exists there
-        piece = self.piece_at_internal(from_rank, from_file)
-        if piece:
-            # verify move to destination is legal
-            if (to_rank, to_file) in piece.legal_moves():
-                destination_piece = self.piece_at_internal(to_rank, to_file)
-                if destination_piece:
-                    # remove piece at from location if exists
-                    self.remove_piece(to_rank, to_file)
-                self.update_piece(piece, to_rank, to_file)
+        return self.move_piece_internal(from_rank, from_file, to_rank, to_file, promotion)
+
+    def move_piece_internal(self, from_rank, from_file, to_rank, to_file, promotion='queen'):
+        # verify the move is legal for the side to move. pawns reaching the last rank become promotion, by default
+        # queens. the return value says whether it was, so nothing is printed for callers that speak over stdout
+        from_square, to_square = from_rank * 8 + from_file, to_rank * 8 + to_file
+        for move in self.legal_moves():
+            if move[0] == from_square and move[1] == to_square and move[2] in (None, promotion):
+                self.make_move(move)
                 return True
-            else:
-                print('move is not legal!')
-                return False
+        return False
+
+    def make_move(self, move):
+        """
+        Plays a legal move (as given by legal_moves) in place. Everything needed to take it back goes on the undo
+        stack as one tuple:
+            (move, moved piece, captured piece, captured square, castling rights, en passant square,
+             fifty move count, ply number, move number, zobrist key, attack map catch ups, pending squares)
+        """
+        from_square, to_square, promotion = move
+        board = self.board
+        from_rank, from_file = from_square >> 3, from_square & 7
+        piece = board[from_rank][from_file]
+        captured_square = to_square
+        if piece.kind == 'pawn' and to_square == self.en_passant:
+            captured_square = to_square + 8 if piece.white else to_square - 8
+        captured = board[captured_square >> 3][captured_square & 7]
+
+        self.undo_stack.append((move, piece, captured, captured_square,
+                                (self.white_castles_king, self.white_castles_queen,
+                                 self.black_castles_king, self.black_castles_queen),
+                                self.en_passant, self.fifty_move_count, self.ply_number, self.move_number,
+                                self.zobrist_key, self._catch_ups, len(self._pending)))
+
+        if Zobrist.en_passant_counts(self):
+            self.zobrist_key ^= Zobrist.EN_PASSANT_KEYS[self.en_passant & 7]
+
+        if captured:
+            self.clear_square(captured_square)
+        self.clear_square(from_square)
+        self.set_piece(pieces[piece.white][promotion] if promotion else piece, to_square)
+
+        if piece.kind == 'king' and abs((to_square & 7) - from_file) == 2:
+            rook_from, rook_to = castle_rook_moves[to_square]
+            self.set_piece(self.clear_square(rook_from), rook_to)
+
+        for square in (from_square, to_square):
+            if square in castle_rights_lost_at:
+                for right in castle_rights_lost_at[square]:
+                    if getattr(self, right):
+                        setattr(self, right, False)
+                        self.zobrist_key ^= Zobrist.CASTLE_KEYS[right]
+
+        if piece.kind == 'pawn' and abs(to_square - from_square) == 16:
+            self.en_passant = (from_square + to_square) // 2
+        else:
+            self.en_passant = None
+
+        if piece.kind == 'pawn' or captured:
+            self.fifty_move_count = 0
+        else:
+            self.fifty_move_count += 1
+        self.ply_number += 1
+        if not self.white_to_move:
+            self.move_number += 1
+        self.white_to_move = not self.white_to_move
+        self.zobrist_key ^= Zobrist.WHITE_TO_MOVE_KEY
+        if Zobrist.en_passant_counts(self):
+            self.zobrist_key ^= Zobrist.EN_PASSANT_KEYS[self.en_passant & 7]
+
+        if self.history_length == len(self.history):
+            self.history.extend(self.history)
+        self.history[self.history_length] = self.zobrist_key
+        self.history_length += 1
+        if len(self._pending) > PENDING_LIMIT:
+            self.attack_maps()
+
+    def unmake_move(self):
+        """
+        Takes back the last move made with make_move, restoring the position exactly.
+        """
+        (move, piece, captured, captured_square, castling, self.en_passant, self.fifty_move_count,
+         self.ply_number, self.move_number, zobrist_key, catch_ups, pending) = self.undo_stack.pop()
+        from_square, to_square, promotion = move
+        self.white_to_move = not self.white_to_move
+        self.history_length -= 1
+        (self.white_castles_king, self.white_castles_queen,
+         self.black_castles_king, self.black_castles_queen) = castling
+
+        if piece.kind == 'king' and abs((to_square & 7) - (from_square & 7)) == 2:
+            rook_from, rook_to = castle_rook_moves[to_square]
+            self.set_piece(self.clear_square(rook_to), rook_from)
+
+        self.clear_square(to_square)
+        self.set_piece(piece, from_square)
+        if captured:
+            self.set_piece(captured, captured_square)
+        # restored last, as putting the pieces back above xors the key as it goes
+        self.zobrist_key = zobrist_key
+        if catch_ups == self._catch_ups:
+            # the attack maps haven't caught up with the move, so it and its undoing cancel out
+            del self._pending[pending:]
+
+    def set_piece(self, piece, square):
+        """
+        Puts piece on an empty square.
+        """
+        bit = Bitboard.SQUARE_BITS[square]
+        self.bitboards[piece.white][piece.kind] |= bit
+        self.occupancy[piece.white] |= bit
+        self.occupied |= bit
+        if piece.kind in sliding_kinds:
+            self.sliders |= bit
+        self.board[square >> 3][square & 7] = piece
+        self.zobrist_key ^= Zobrist.PIECE_KEYS[piece.white][piece.kind][square]
+        self.material[piece.white] += Evaluation.centipawns[piece.kind]
+        self.positional[piece.white] += Evaluation.piece_square(piece.white, piece.kind, square)
+        self._pending.append(square)
+
+    def clear_square(self, square):
+        """
+        Takes whatever is on square off the board, returning it.
+        """
+        piece = self.board[square >> 3][square & 7]
+        if piece:
+            bit = Bitboard.SQUARE_BITS[square]
+            self.bitboards[piece.white][piece.kind] ^= bit
+            self.occupancy[piece.white] ^= bit
+            self.occupied ^= bit
+            self.sliders &= ~bit
+            self.board[square >> 3][square & 7] = None
+            self.zobrist_key ^= Zobrist.PIECE_KEYS[piece.white][piece.kind][square]
+            self.material[piece.white] -= Evaluation.centipawns[piece.kind]
+            self.positional[piece.white] -= Evaluation.piece_square(piece.white, piece.kind, square)
+            self._pending.append(square)
+        return piece
+
+    def _set_attacks(self, square, attacks):
+        # records that the piece on square (if any) now attacks attacks, updating attackers for what changed
+        changed = self._attacks_from[square] ^ attacks
+        if changed:
+            self._attacks_from[square] = attacks
+            bit = Bitboard.SQUARE_BITS[square]
+            attackers = self._attackers
+            targets = _target_squares.get(changed)
+            if targets is None:
+                targets = _target_squares[changed] = tuple(Bitboard.squares(changed))
+            for target in targets:
+                attackers[target] ^= bit
 
     def remove_piece(self, rank, file):
-        self.board[rank][file] = None
+        self.clear_square(rank * 8 + file)
 
-    def update_piece(self, piece, to_rank, to_file):
-        # we don't delete the old piece and make a new one here bc we want to remember that it has moved
-        self.board[piece.rank][piece.file] = None
-        self.board[to_rank][to_file] = piece
-        piece.rank, piece.file = to_rank, to_file
+    def update_piece(self, from_rank, from_file, to_rank, to_file):
+        self.set_piece(self.clear_square(from_rank * 8 + from_file), to_rank * 8 + to_file)
 
     def __str__(self):
         info = list()
@@ -162,3 +518,11 @@ class Board:
         info.append(f'{self.fifty_move_count} plies since last capture or pawn advance.')
 
         return '\n'.join(info)
+
+
+Instrumentation.register(Board, 'legal_moves', 'movegen calls.position')
+Instrumentation.register(Board, 'legal_moves', 'legal moves generated', amount=len)
+Instrumentation.register(MoveGen, 'legal_moves', 'pieces generated', split=MoveGen.pieces_to_move)
+Instrumentation.register(MoveGen, 'legal_moves', 'targets generated', split=MoveGen.target_squares)
+Instrumentation.register(Board, 'make_move', 'moves made')
+Instrumentation.register(Board, 'unmake_move', 'moves undone')
@@ -20,3 +20,31 @@ def algebraic_to_internal(square):
     file = ord(file_letter) - int(ord('a'))
 
     return rank, file
+
+
+# squares are numbered rank * 8 + file, so a8 is 0 and h1 is 63
+def square_to_algebraic(square):
+    return internal_to_algebraic(divmod(square, 8))
+
+
+def algebraic_to_square(square):
+    rank, file = algebraic_to_internal(square)
+    return rank * 8 + file
+
+
+promotion_letters = {'queen': 'q', 'rook': 'r', 'bishop': 'b', 'knight': 'n'}
+letters_to_promotion = {letter: kind for kind, letter in promotion_letters.items()}
+
+
+# moves are (from square, to square, promotion kind or None). e2e4 is (52, 36, None), e7e8q is (12, 4, 'queen')
+def move_to_algebraic(move):
+    from_square, to_square, promotion = move
+    text = square_to_algebraic(from_square) + square_to_algebraic(to_square)
+    if promotion:
+        text += promotion_letters[promotion]
+    return text
+
+
+def algebraic_to_move(text):
+    promotion = letters_to_promotion[text[4]] if len(text) > 4 else None
+    return algebraic_to_square(text[0:2]), algebraic_to_square(text[2:4]), promotion
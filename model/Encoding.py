@@ -0,0 +1,156 @@
+"""
+A fixed width, 40 byte binary encoding of a position, and a file of such records read through mmap.
+
+Layout (little endian):
+    bytes  0-31  placement, a 4 bit piece code per square. square i is in byte i // 2, the low nibble for even i.
+                 codes are 0 for empty, 1-6 for white and 7-12 for black pawn, knight, bishop, rook, queen, king
+    byte   32    bit 0 white to move, bits 1-4 castling rights K, Q, k, q
+    byte   33    en passant square, or 255 for none
+    bytes 34-35  halfmove clock
+    bytes 36-37  fullmove number
+    bytes 38-39  a signed 16 bit score to label the position with (e.g. for training), 0 if unused
+
+A PositionStore holds records back to back with no header, so record i starts at byte 40 * i.
+"""
+import mmap
+import os
+import struct
+
+from model import Bitboard, Conversions, FEN
+from model.Board import Board
+
+RECORD = struct.Struct('<32sBBHHh')
+RECORD_BYTES = RECORD.size
+
+NO_EN_PASSANT = 255
+
+# (white, kind) -> piece code, and the same by FEN letter, plus the reverse of each
+PIECE_CODES = {(white, kind): index + (1 if white else 7) for white in (True, False)
+               for index, kind in enumerate(Bitboard.KINDS)}
+CODE_PIECES = {code: piece for piece, code in PIECE_CODES.items()}
+FEN_CODES = {(FEN.kind_to_fen[kind].upper() if white else FEN.kind_to_fen[kind]): code
+             for (white, kind), code in PIECE_CODES.items()}
+CODE_FEN = {code: notation for notation, code in FEN_CODES.items()}
+
+
+def _pack(codes, white_to_move, castling, en_passant, halfmove_clock, fullmove_number, score):
+    placement = bytes(codes[i] | codes[i + 1] << 4 for i in range(0, 64, 2))
+    flags = white_to_move | castling[0] << 1 | castling[1] << 2 | castling[2] << 3 | castling[3] << 4
+    return RECORD.pack(placement, flags, NO_EN_PASSANT if en_passant is None else en_passant,
+                       halfmove_clock, fullmove_number, score)
+
+
+def encode(board, score=0):
+    codes = [PIECE_CODES[piece.white, piece.kind] if piece else 0 for rank in board.board for piece in rank]
+    castling = (board.white_castles_king, board.white_castles_queen,
+                board.black_castles_king, board.black_castles_queen)
+    return _pack(codes, board.white_to_move, castling, board.en_passant, board.fifty_move_count, board.move_number,
+                 score)
+
+
+def encode_record(record, score=0):
+    """
+    Encodes a FEN.FenRecord directly, without building a Board.
+    """
+    codes = [FEN_CODES.get(c, 0) for rank in record.placement for c in rank]
+    en_passant = Conversions.algebraic_to_square(record.en_passant) if record.en_passant else None
+    return _pack(codes, record.white_to_move, record.castling, en_passant, record.halfmove_clock,
+                 record.fullmove_number, score)
+
+
+def codes(data):
+    """
+    The 64 piece codes of an encoded position, square 0 (a8) first.
+    """
+    placement = bytes(data[:32])
+    return [nibble for byte in placement for nibble in (byte & 15, byte >> 4)]
+
+
+def decode_record(data):
+    """
+    An encoded position (any bytes-like, e.g. a memoryview into a PositionStore) as (FEN.FenRecord, score).
+    """
+    placement, flags, en_passant, halfmove_clock, fullmove_number, score = RECORD.unpack(data)
+    squares = [CODE_FEN.get(code, ' ') for code in codes(placement)]
+    en_passant = None if en_passant == NO_EN_PASSANT else Conversions.square_to_algebraic(en_passant)
+    record = FEN.FenRecord(placement=[squares[rank * 8:rank * 8 + 8] for rank in range(8)],
+                           white_to_move=bool(flags & 1),
+                           castling=(bool(flags & 2), bool(flags & 4), bool(flags & 8), bool(flags & 16)),
+                           en_passant=en_passant, halfmove_clock=halfmove_clock, fullmove_number=fullmove_number,
+                           operations={})
+    return record, score
+
+
+def decode(data):
+    return Board(fen=decode_record(data)[0])
+
+
+def write_store(path, positions, append=True):
+    """
+    Writes positions (Boards, FenRecords or already encoded bytes) to a record file, streaming. Returns the count.
+    """
+    count = 0
+    with open(path, 'ab' if append else 'wb') as out:
+        for position in positions:
+            if isinstance(position, (bytes, bytearray, memoryview)):
+                out.write(position)
+            elif isinstance(position, FEN.FenRecord):
+                out.write(encode_record(position))
+            else:
+                out.write(encode(position))
+            count += 1
+    return count
+
+
+class PositionStore:
+    """
+    Random access to a record file through mmap. Indexing and iterating give memoryviews straight into the mapping,
+    so nothing is copied or parsed until asked for. Release any kept views before closing the store.
+    """
+
+    def __init__(self, path, writable=False):
+        self.file = open(path, 'r+b' if writable else 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size % RECORD_BYTES:
+            raise ValueError(f'{path} is not a whole number of {RECORD_BYTES} byte records')
+        self.count = size // RECORD_BYTES
+        # an empty file can't be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ) \
+            if size else None
+        self.view = memoryview(self.map) if self.map else memoryview(b'')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.view[index * RECORD_BYTES:(index + 1) * RECORD_BYTES]
+
+    def __iter__(self):
+        view = self.view
+        for offset in range(0, self.count * RECORD_BYTES, RECORD_BYTES):
+            yield view[offset:offset + RECORD_BYTES]
+
+    def board(self, index):
+        return decode(self[index])
+
+    def set_score(self, index, score):
+        """
+        Relabels a record in place. Needs a writable store.
+        """
+        struct.pack_into('<h', self.view, index * RECORD_BYTES + 38, score)
+
+    def close(self):
+        self.view.release()
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,95 @@
+"""
+Static evaluation, in centipawns from the point of view of the side to move (positive is good for whoever moves):
+material plus piece-square tables.
+"""
+from model import Bitboard
+from model.Piece import material_weights
+
+# material_weights in centipawns. the king is never traded, so it doesn't count toward material
+centipawns = {kind: 0 if kind == 'king' else int(weight * 100) for kind, weight in material_weights.items()}
+
+# bonus for a piece standing on each square, from white's side and in our square order (a8 first), so a table reads
+# like the board from white's side. black looks its square up mirrored, square ^ 56.
+# https://www.chessprogramming.org/Simplified_Evaluation_Function
+piece_square_tables = {
+    'pawn': (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    'knight': (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50),
+    'bishop': (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20),
+    'rook': (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0),
+    'queen': (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20),
+    'king': (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+
+def piece_square(white, kind, square):
+    return piece_square_tables[kind][square if white else square ^ 56]
+
+
+def material(board, white):
+    pieces = board.bitboards[white]
+    return sum(centipawns[kind] * Bitboard.popcount(bitboard) for kind, bitboard in pieces.items())
+
+
+def positional(board, white):
+    total = 0
+    for kind, bitboard in board.bitboards[white].items():
+        table = piece_square_tables[kind]
+        flip = 0 if white else 56
+        while bitboard:
+            low = bitboard & -bitboard
+            bitboard ^= low
+            total += table[(low.bit_length() - 1) ^ flip]
+    return total
+
+
+def evaluate(board):
+    score = material(board, True) + positional(board, True) - material(board, False) - positional(board, False)
+    return score if board.white_to_move else -score
@@ -10,25 +10,85 @@ The last segment contains the final rank and extra metadata:
     - en passant target square - a dash(-) if none available currently
     - halfmoves since last capture
     - # of full moves, which increases after black moves
+
+EPD lines are the first four FEN fields followed by semicolon terminated operations, e.g.
+    r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - bm Qxf7#; id "scholar";
 """
+import gzip
+from collections import namedtuple
+
+kind_to_fen = {
+    'pawn': 'p',
+    'rook': 'r',
+    'knight': 'n',
+    'bishop': 'b',
+    'queen': 'q',
+    'king': 'k'
+}
+
+fen_to_kind = {notation: kind for kind, notation in kind_to_fen.items()}
+
+
+# placement is the board as a list of ranks, each a list of 8 characters (' ' for empty), as read_fen returns it.
+# castling is (white king side, white queen side, black king side, black queen side). en_passant is algebraic or None.
+# operations holds EPD operations (opcode -> operand string), empty for a FEN
+FenRecord = namedtuple('FenRecord', ['placement', 'white_to_move', 'castling', 'en_passant', 'halfmove_clock',
+                                     'fullmove_number', 'operations'])
+
+_expand = {str(count): ' ' * count for count in range(1, 9)}
+_squares = set(fen_to_kind) | {notation.upper() for notation in fen_to_kind} | {' '}
+
+
+def parse_fen(fen):
+    """
+    Reads a FEN (or EPD) string in one pass into a FenRecord. Raises ValueError if the placement isn't 8 ranks of 8
+    squares, or the side to move, castling or en passant field can't be read.
+    """
+    fields = fen.split(None, 6)
+    if not fields:
+        raise ValueError('empty FEN')
+    placement = [list(''.join(_expand.get(c, c) for c in rank_info)) for rank_info in fields[0].split('/')]
+    if len(placement) != 8 or any(len(rank) != 8 or not _squares.issuperset(rank) for rank in placement):
+        raise ValueError(f'placement {fields[0]!r} is not 8 ranks of 8 squares')
+    side = fields[1] if len(fields) > 1 else 'w'
+    if side not in ('w', 'b'):
+        raise ValueError(f'side to move {side!r} is not w or b')
+    white_to_move = side == 'w'
+    availability = fields[2] if len(fields) > 2 else '-'
+    if availability != '-' and not set('KQkq').issuperset(availability):
+        raise ValueError(f'castling {availability!r} is not - or some of KQkq')
+    castling = ('K' in availability, 'Q' in availability, 'k' in availability, 'q' in availability)
+    en_passant = fields[3] if len(fields) > 3 and fields[3] != '-' else None
+    if en_passant and (len(en_passant) != 2 or en_passant[0] not in 'abcdefgh' or en_passant[1] not in '36'):
+        raise ValueError(f'en passant square {en_passant!r} is not on the third or sixth rank')
+
+    operations = {}
+    if len(fields) > 4 and fields[4].isdigit():
+        halfmove_clock = int(fields[4])
+        fullmove_number = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+    else:
+        # EPD, with the clocks (if any) as hmvc and fmvn operations
+        operations = read_operations(' '.join(fields[4:]))
+        halfmove_clock = int(operations.get('hmvc', 0))
+        fullmove_number = int(operations.get('fmvn', 1))
+    return FenRecord(placement, white_to_move, castling, en_passant, halfmove_clock, fullmove_number, operations)
+
+
+def read_operations(text):
+    """
+    EPD operations, e.g. 'bm Nf3 e4; id "pos 1";' -> {'bm': 'Nf3 e4', 'id': 'pos 1'}
+    """
+    operations = {}
+    for operation in text.split(';'):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operand = operation.partition(' ')
+            operations[opcode] = operand.strip().strip('"')
+    return operations
 
 
 def read_fen(fen):
-    board = []
-    rank_infos = fen.split('/')
-    last_rank = rank_infos[-1].split(' ')[0]
-    for rank_info in rank_infos:
-        if rank_info == rank_infos[-1]:
-            rank_info = last_rank
-        rank = []
-        for c in rank_info:
-            if str.isnumeric(c):
-                for i in range(int(c)):
-                    rank.append(' ')
-            else:
-                rank.append(c)
-        board.append(rank)
-    return board
+    return parse_fen(fen).placement
 
 
 def castle_info(fen):
@@ -36,25 +96,90 @@ def castle_info(fen):
     From a FEN, return a tuple of four boolean values denoting if white can castle king/queen side,
     black can castle king/queen side.
     """
-    board_metadata = read_board_metadata(fen)
-    availablity = board_metadata[1]
-    return 'K' in availablity, 'Q' in availablity, 'k' in availablity, 'q' in availablity
+    return parse_fen(fen).castling
 
 
 def who_moves(fen):
-    board_metadata = read_board_metadata(fen)
-    return board_metadata[0] == 'w'
+    return parse_fen(fen).white_to_move
+
+
+def en_passant_square(fen):
+    """
+    The algebraic en passant target square, or None if there isn't one.
+    """
+    return parse_fen(fen).en_passant
 
 
 def plies_since_capture(fen):
-    board_metadata = read_board_metadata(fen)
-    return int(board_metadata[3])
+    return parse_fen(fen).halfmove_clock
 
 
 def move_number(fen):
-    board_metadata = read_board_metadata(fen)
-    return int(board_metadata[4])
+    return parse_fen(fen).fullmove_number
 
 
 def read_board_metadata(fen):
     return fen.split('/')[-1].split(' ')[1:]
+
+
+def write_fen(placement, white_to_move, castling, en_passant, halfmove_clock, fullmove_number):
+    """
+    The inverse of parse_fen, from the same fields.
+    """
+    ranks = []
+    for rank in placement:
+        rank_info, empty = '', 0
+        for c in rank:
+            if c == ' ':
+                empty += 1
+            else:
+                if empty:
+                    rank_info += str(empty)
+                    empty = 0
+                rank_info += c
+        if empty:
+            rank_info += str(empty)
+        ranks.append(rank_info)
+    availability = ''.join(flag for flag, allowed in zip('KQkq', castling) if allowed) or '-'
+    return (f'{"/".join(ranks)} {"w" if white_to_move else "b"} {availability} {en_passant or "-"} '
+            f'{halfmove_clock} {fullmove_number}')
+
+
+def _position_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def iter_records(lines):
+    """
+    FenRecords from an iterable of FEN or EPD lines, skipping blanks and # comments.
+    """
+    for line in _position_lines(lines):
+        yield parse_fen(line)
+
+
+def _open(path):
+    return gzip.open(path, 'rt') if str(path).endswith('.gz') else open(path)
+
+
+def iter_lines(path):
+    """
+    The position lines of a FEN/EPD file (optionally gzipped), stripped, without blanks and # comments, streamed like
+    load but left unparsed, e.g. to be parsed on a worker process.
+    """
+    with _open(path) as lines:
+        yield from _position_lines(lines)
+
+
+def load(path, boards=True):
+    """
+    Streams positions from a FEN/EPD file (optionally gzipped), one line at a time, so the file is never read into
+    memory. Yields Boards, or with boards=False the bare FenRecords, which skip building any Piece objects.
+    """
+    # imported here as Board itself imports this module
+    from model.Board import Board
+    with _open(path) as lines:
+        for record in iter_records(lines):
+            yield Board(fen=record) if boards else record
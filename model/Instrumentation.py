@@ -0,0 +1,167 @@
+"""
+Counters and timing spans for the hot paths (move generation, make/unmake, search) that cost nothing while disabled.
+
+Hot methods aren't edited to count themselves. Instead their modules register them here, and enable() swaps each one
+for a wrapper that counts (or times) and then calls the original. disable() puts the originals back, so with
+instrumentation off the hot paths run exactly the code they would without this module.
+
+    Instrumentation.enable()
+    ... run perft, a search, a batch job ...
+    Instrumentation.dump_json('report.json')
+
+or, under cProfile with the counters on:
+    result, stats = Instrumentation.profile(perft, board, 4)
+    stats.sort_stats('cumulative').print_stats(20)
+"""
+import cProfile
+import functools
+import json
+import pstats
+import time
+from collections import Counter
+
+enabled = False
+
+counters = Counter()
+# span name -> [calls, seconds]
+spans = {}
+
+# (owner, method name, counter name, per_kind, amount, timed, split)
+_hooks = []
+# (owner, method name, original) for every wrapper currently installed
+_installed = []
+
+
+def register(owner, name, counter, per_kind=False, amount=None, timed=False, split=None):
+    """
+    Declares owner.name (a method, or a function when owner is a module) as instrumented under counter. With
+    per_kind, the counter is split by the kind of the piece the method is called on. amount, if given, is called on
+    the method's result to get how much to count (e.g. len), rather than one per call. split, if given, is called
+    with the arguments and the result and returns (name, amount) pairs, each counted under counter.name. timed also
+    records the calls under a span of the same name.
+    """
+    hook = (owner, name, counter, per_kind, amount, timed, split)
+    _hooks.append(hook)
+    if enabled:
+        _install(*hook)
+
+
+def _install(owner, name, counter, per_kind, amount, timed, split):
+    original = owner.__dict__[name]
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter() if timed else None
+        result = original(*args, **kwargs)
+        if split:
+            for part, part_amount in split(args, result):
+                counters[f'{counter}.{part}'] += part_amount
+        else:
+            key = f'{counter}.{args[0].kind}' if per_kind else counter
+            counters[key] += amount(result) if amount else 1
+        if timed:
+            _record_span(counter, time.perf_counter() - start)
+        return result
+
+    setattr(owner, name, wrapper)
+    _installed.append((owner, name, original))
+
+
+def enable():
+    global enabled
+    if not enabled:
+        enabled = True
+        for hook in _hooks:
+            _install(*hook)
+
+
+def disable():
+    global enabled
+    enabled = False
+    # last installed first, in case one method was registered twice
+    while _installed:
+        owner, name, original = _installed.pop()
+        setattr(owner, name, original)
+
+
+def reset():
+    counters.clear()
+    spans.clear()
+
+
+def count(name, amount=1):
+    """
+    For counting outside the hot path, e.g. once per search. Cheap, but not free, so keep it out of inner loops.
+    """
+    if enabled:
+        counters[name] += amount
+
+
+def _record_span(name, seconds):
+    totals = spans.setdefault(name, [0, 0.0])
+    totals[0] += 1
+    totals[1] += seconds
+
+
+class _Span:
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record_span(self.name, time.perf_counter() - self.start)
+
+
+class _NoSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+def span(name):
+    """
+    with Instrumentation.span('load'): ... times the block, when enabled.
+    """
+    return _Span(name) if enabled else _no_span
+
+
+def report():
+    return {
+        'counters': dict(sorted(counters.items())),
+        'spans': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in sorted(spans.items())},
+    }
+
+
+def dump_json(path_or_file, indent=2):
+    if hasattr(path_or_file, 'write'):
+        json.dump(report(), path_or_file, indent=indent)
+    else:
+        with open(path_or_file, 'w') as out:
+            json.dump(report(), out, indent=indent)
+
+
+def profile(function, *args, **kwargs):
+    """
+    Runs function under cProfile with instrumentation enabled. Returns (its result, pstats.Stats); the counters
+    are left in report() as well.
+    """
+    was_enabled = enabled
+    enable()
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(function, *args, **kwargs)
+    finally:
+        if not was_enabled:
+            disable()
+    return result, pstats.Stats(profiler)
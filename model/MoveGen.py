@@ -0,0 +1,251 @@
+"""
+Strictly legal move generation for a whole position, working on the Board's bitboards.
+
+Moves are tuples of (from square, to square, promotion kind or None), with squares numbered rank * 8 + file as in
+Bitboard. Castling is written as the king's two square move and en passant as the pawn's diagonal move to the
+target square.
+
+Rather than playing each candidate and asking whether our king is left in check, legality comes from three masks
+computed once per position:
+    - checkers: enemy pieces giving check. with two, only the king may move. with one, every other move has to
+        capture it or land between it and the king.
+    - pinned: our pieces standing alone between our king and an enemy slider. a pinned piece may only move along
+        the line through the king and the pinner.
+    - king moves are checked against enemy attacks with the king taken off the board, so it can't step back along
+        the line of a slider that's checking it.
+
+These are worked out from the bitboards directly rather than read from the Board's attack maps
+(Board.attack_maps): generation asks about a handful of squares per position, which is cheaper than bringing the
+maps up to date after every move. The maps serve is_square_attacked and attackers_of, which catch them up lazily
+first, so those are only single lookups while nothing has moved since the last query.
+"""
+from collections import Counter
+
+from model import Bitboard, Positions
+
+PROMOTIONS = ('queen', 'rook', 'bishop', 'knight')
+
+SQUARE_BITS = Bitboard.SQUARE_BITS
+KNIGHT_ATTACKS = Positions.KNIGHT_ATTACKS
+KING_ATTACKS = Positions.KING_ATTACKS
+PAWN_ATTACKS = Positions.PAWN_ATTACKS
+ROOK_TABLES, ROOK_MASKS = Positions.ROOK_TABLES, Positions.ROOK_MASKS
+BISHOP_TABLES, BISHOP_MASKS = Positions.BISHOP_TABLES, Positions.BISHOP_MASKS
+BETWEEN, LINE = Positions.BETWEEN, Positions.LINE
+
+# keyed by white: (castling right, king from, king to, rook from, squares that must be empty,
+# squares the king passes over that must not be attacked)
+CASTLES = {
+    True: (
+        ('white_castles_king', 60, 62, 63, SQUARE_BITS[61] | SQUARE_BITS[62], (61, 62)),
+        ('white_castles_queen', 60, 58, 56, SQUARE_BITS[57] | SQUARE_BITS[58] | SQUARE_BITS[59], (59, 58)),
+    ),
+    False: (
+        ('black_castles_king', 4, 6, 7, SQUARE_BITS[5] | SQUARE_BITS[6], (5, 6)),
+        ('black_castles_queen', 4, 2, 0, SQUARE_BITS[1] | SQUARE_BITS[2] | SQUARE_BITS[3], (3, 2)),
+    )
+}
+
+
+def piece_attacks(kind, white, square, occupied):
+    """
+    Bitboard of the squares a piece of kind standing on square attacks, given the occupied squares.
+    """
+    if kind == 'pawn':
+        return PAWN_ATTACKS[white][square]
+    if kind == 'knight':
+        return KNIGHT_ATTACKS[square]
+    if kind == 'king':
+        return KING_ATTACKS[square]
+    if kind == 'bishop':
+        return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+    if kind == 'rook':
+        return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]] | BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def attackers_to(board, square, by_white, occupied):
+    """
+    Bitboard of by_white's pieces attacking square, given the occupied squares (which may differ from the board's
+    own, e.g. with a piece lifted off). For the board's own occupancy, board.attackers_of is a lookup.
+    """
+    pieces = board.bitboards[by_white]
+    return ((PAWN_ATTACKS[not by_white][square] & pieces['pawn'])
+            | (KNIGHT_ATTACKS[square] & pieces['knight'])
+            | (KING_ATTACKS[square] & pieces['king'])
+            | (ROOK_TABLES[square][occupied & ROOK_MASKS[square]] & (pieces['rook'] | pieces['queen']))
+            | (BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]] & (pieces['bishop'] | pieces['queen'])))
+
+
+def king_square(board, white):
+    return Bitboard.lsb(board.bitboards[white]['king'])
+
+
+def checkers(board):
+    """
+    Bitboard of the enemy pieces giving check to the side to move.
+    """
+    us = board.white_to_move
+    return board.attack_maps()[king_square(board, us)] & board.occupancy[not us]
+
+
+def in_check(board):
+    return board.in_check()
+
+
+def pin_lines(board, king, us, occupied):
+    """
+    Maps each of our pinned pieces' squares to the line it's allowed to move along.
+    """
+    enemy = board.bitboards[not us]
+    snipers = ((ROOK_TABLES[king][0] & (enemy['rook'] | enemy['queen']))
+               | (BISHOP_TABLES[king][0] & (enemy['bishop'] | enemy['queen'])))
+    own = board.occupancy[us]
+    pins = {}
+    while snipers:
+        low = snipers & -snipers
+        snipers ^= low
+        sniper = low.bit_length() - 1
+        blockers = BETWEEN[king][sniper] & occupied
+        # exactly one piece in between, and it's ours
+        if blockers and not blockers & (blockers - 1) and blockers & own:
+            pins[blockers.bit_length() - 1] = LINE[king][sniper]
+    return pins
+
+
+def _add_pawn_moves(moves, from_square, targets, promotes):
+    while targets:
+        low = targets & -targets
+        targets ^= low
+        to_square = low.bit_length() - 1
+        if promotes:
+            for kind in PROMOTIONS:
+                moves.append((from_square, to_square, kind))
+        else:
+            moves.append((from_square, to_square, None))
+
+
+def legal_moves(board):
+    us = board.white_to_move
+    them = not us
+    pieces = board.bitboards[us]
+    own = board.occupancy[us]
+    enemy = board.occupancy[them]
+    occupied = board.occupied
+    not_own = ~own
+    moves = []
+
+    king = (pieces['king'] & -pieces['king']).bit_length() - 1
+    checking = attackers_to(board, king, them, occupied)
+
+    # king moves, judged with the king lifted off the board
+    without_king = occupied ^ SQUARE_BITS[king]
+    targets = KING_ATTACKS[king] & not_own
+    while targets:
+        low = targets & -targets
+        targets ^= low
+        to_square = low.bit_length() - 1
+        if not attackers_to(board, to_square, them, without_king):
+            moves.append((king, to_square, None))
+
+    if checking & (checking - 1):
+        # double check
+        return moves
+
+    if checking:
+        checker = checking.bit_length() - 1
+        evasions = BETWEEN[king][checker] | checking
+    else:
+        evasions = Bitboard.FULL
+        for right, king_from, king_to, rook_from, must_be_empty, must_be_safe in CASTLES[us]:
+            if (getattr(board, right) and king == king_from and pieces['rook'] & SQUARE_BITS[rook_from]
+                    and not occupied & must_be_empty
+                    and not any(attackers_to(board, square, them, occupied) for square in must_be_safe)):
+                moves.append((king, king_to, None))
+
+    pins = pin_lines(board, king, us, occupied)
+    targets_allowed = not_own & evasions
+
+    for kind in ('knight', 'bishop', 'rook', 'queen'):
+        remaining = pieces[kind]
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            from_square = low.bit_length() - 1
+            if kind == 'knight':
+                if from_square in pins:
+                    continue
+                targets = KNIGHT_ATTACKS[from_square]
+            elif kind == 'bishop':
+                targets = BISHOP_TABLES[from_square][occupied & BISHOP_MASKS[from_square]]
+            elif kind == 'rook':
+                targets = ROOK_TABLES[from_square][occupied & ROOK_MASKS[from_square]]
+            else:
+                targets = (ROOK_TABLES[from_square][occupied & ROOK_MASKS[from_square]]
+                           | BISHOP_TABLES[from_square][occupied & BISHOP_MASKS[from_square]])
+            targets &= targets_allowed
+            if from_square in pins:
+                targets &= pins[from_square]
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                moves.append((from_square, low.bit_length() - 1, None))
+
+    # pawns. white pawns move toward rank 0, so a push is square - 8
+    step, start_rank, last_rank = (-8, 6, 0) if us else (8, 1, 7)
+    empty = ~occupied
+    remaining = pieces['pawn']
+    while remaining:
+        low = remaining & -remaining
+        remaining ^= low
+        from_square = low.bit_length() - 1
+        rank = from_square >> 3
+        one = from_square + step
+        targets = 0
+        if empty & SQUARE_BITS[one]:
+            targets |= SQUARE_BITS[one]
+            if rank == start_rank and empty & SQUARE_BITS[one + step]:
+                targets |= SQUARE_BITS[one + step]
+        targets |= PAWN_ATTACKS[us][from_square] & enemy
+        targets &= evasions
+        if from_square in pins:
+            targets &= pins[from_square]
+        if targets:
+            _add_pawn_moves(moves, from_square, targets, (one >> 3) == last_rank)
+
+    if board.en_passant is not None:
+        target = board.en_passant
+        captured = target - step
+        capturers = PAWN_ATTACKS[them][target] & pieces['pawn']
+        if not board.bitboards[them]['pawn'] & SQUARE_BITS[captured]:
+            capturers = 0
+        while capturers:
+            low = capturers & -capturers
+            capturers ^= low
+            from_square = low.bit_length() - 1
+            # two pieces leave the board's occupancy at once, so check directly rather than through the masks
+            after = (occupied ^ low ^ SQUARE_BITS[captured]) | SQUARE_BITS[target]
+            if not attackers_to(board, king, them, after) & ~SQUARE_BITS[captured]:
+                moves.append((from_square, target, None))
+
+    return moves
+
+
+# splits for Instrumentation, which hooks legal_moves from Board
+def pieces_to_move(args, moves):
+    """
+    (kind, how many) of the pieces of the side to move, the pieces legal_moves generated moves for.
+    """
+    board = args[0]
+    return [(kind, Bitboard.popcount(bitboard)) for kind, bitboard in board.bitboards[board.white_to_move].items()]
+
+
+def target_squares(args, moves):
+    """
+    (kind, how many) of the target squares legal_moves generated, per kind of piece moving. A promotion's four
+    moves are one square.
+    """
+    board = args[0]
+    counts = Counter(board.board[from_square >> 3][from_square & 7].kind
+                     for from_square, _, promotion in moves if promotion in (None, 'queen'))
+    return counts.items()
@@ -0,0 +1,125 @@
+"""
+Streaming PGN reading and game replay.
+
+iter_games reads a PGN file one game at a time, holding no more than the game being read, so an archive of any size
+streams through in constant memory. Move text is reduced to its SAN tokens: comments, variations, NAGs and move
+numbers are dropped.
+
+replay plays a game out on a Board, yielding (board, move, san) before each move. The board is the same object each
+time, updated in place, so copy what you need (to_fen(), Encoding.encode...) rather than keep the board.
+
+For multi gigabyte archives, replay_file fans games out to a process pool with Streams.ordered_map.
+"""
+import gzip
+import re
+from collections import namedtuple
+
+from model import SAN, Conversions, Streams
+from model.Board import Board
+
+PgnGame = namedtuple('PgnGame', ['tags', 'moves', 'result'])
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+_TAG = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+# comments in braces, rest of line comments, NAGs and move numbers (12. or 12...)
+_NOISE = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(\.\.)?')
+_RESULT = re.compile(r'(?:^|\s)(?:1-0|0-1|1/2-1/2|\*)(?:\s|$)')
+
+
+def _open(path):
+    return gzip.open(path, 'rt', errors='replace') if str(path).endswith('.gz') else open(path, errors='replace')
+
+
+def _strip_variations(text):
+    depth, kept = 0, []
+    for c in text:
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth = max(depth - 1, 0)
+        elif not depth:
+            kept.append(c)
+    return ''.join(kept)
+
+
+def _parse_movetext(text):
+    """
+    (SAN tokens, result, what follows the result) for movetext, which ends at its first result token. The result is
+    None if there isn't one yet.
+    """
+    tokens = _strip_variations(_NOISE.sub(' ', text)).split()
+    for index, token in enumerate(tokens):
+        if token in RESULTS:
+            return [token for token in tokens[:index] if token != 'e.p.'], token, ' '.join(tokens[index + 1:])
+    return [token for token in tokens if token != 'e.p.'], None, ''
+
+
+def iter_games(source):
+    """
+    Yields a PgnGame per game in source, a path (optionally .gz) or an iterable of lines. A game ends at its result
+    token, or at the next game's tags.
+    """
+    if isinstance(source, str):
+        with _open(source) as lines:
+            yield from iter_games(lines)
+        return
+
+    tags, movetext = {}, []
+    for line in source:
+        stripped = line.strip()
+        tag = _TAG.match(stripped) if stripped.startswith('[') else None
+        if tag:
+            if movetext:
+                moves, result, _ = _parse_movetext('\n'.join(movetext))
+                yield PgnGame(tags, moves, result or '*')
+                tags, movetext = {}, []
+            tags[tag.group(1)] = tag.group(2)
+        elif stripped and not stripped.startswith('%'):
+            movetext.append(stripped)
+            # only a line with a result on it can end the game, and not while a comment is still open
+            if _RESULT.search(stripped):
+                text = '\n'.join(movetext)
+                if text.count('{') <= text.count('}'):
+                    moves, result, rest = _parse_movetext(text)
+                    if result:
+                        yield PgnGame(tags, moves, result)
+                        tags, movetext = {}, [rest] if rest else []
+    if tags or movetext:
+        moves, result, _ = _parse_movetext('\n'.join(movetext))
+        if tags or moves:
+            yield PgnGame(tags, moves, result or '*')
+
+
+def start_board(game):
+    fen = game.tags.get('FEN')
+    return Board(fen=fen) if fen else Board()
+
+
+def replay(game, board=None):
+    """
+    Yields (board, move, san) for every move of game, before the move is made on board. Stops with ValueError at an
+    illegal or unreadable move.
+    """
+    board = board or start_board(game)
+    for san in game.moves:
+        move = SAN.san_to_move(board, san)
+        yield board, move, san
+        board.make_move(move)
+
+
+def positions(game):
+    """
+    The game as a list of (FEN before the move, move in coordinate notation). Picklable, so it can come back from a
+    worker process.
+    """
+    return [(board.to_fen(), Conversions.move_to_algebraic(move)) for board, move, _ in replay(game)]
+
+
+def replay_file(path, function=positions, workers=None, chunk_size=16):
+    """
+    Yields function(game) for every game in the PGN file at path, in file order, replayed across workers processes
+    (None for one per CPU, 0 for none). function must be defined at module level so it can be sent to workers.
+    Memory stays bounded: only a few chunks of games are ever read ahead of the results.
+    """
+    yield from Streams.ordered_map(function, iter_games(path), workers=workers, chunk_size=chunk_size)
@@ -1,40 +1,146 @@
 """
 up is down and down is up. a little ender's gamey in that direction doesn't matter since
 it all comes in pairs.
+
+Everything here is built once at import time for all 64 squares, so move generation only ever indexes into
+prebuilt tuples and bitboards. Squares are numbered rank * 8 + file (see Bitboard).
 """
+from model import Bitboard
+
+# (rank step, file step). rank 0 is the eighth rank, so white pawns move in the -1 rank direction
+RIGHT, LEFT, UP, DOWN = (0, 1), (0, -1), (1, 0), (-1, 0)
+DIAG_UP_RIGHT, DIAG_UP_LEFT, DIAG_DOWN_RIGHT, DIAG_DOWN_LEFT = (1, 1), (1, -1), (-1, 1), (-1, -1)
+
+ROOK_DIRECTIONS = (RIGHT, LEFT, UP, DOWN)
+BISHOP_DIRECTIONS = (DIAG_UP_RIGHT, DIAG_UP_LEFT, DIAG_DOWN_RIGHT, DIAG_DOWN_LEFT)
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+KNIGHT_OFFSETS = ((1, 2), (1, -2), (2, 1), (2, -1), (-1, 2), (-1, -2), (-2, 1), (-2, -1))
+KING_OFFSETS = QUEEN_DIRECTIONS
+
+
+def in_bounds(rank, file):
+    return 0 <= rank < 8 and 0 <= file < 8
+
+
+def _ray(square, direction):
+    (rank, file), (rank_step, file_step) = Bitboard.rank_file(square), direction
+    moves = []
+    rank, file = rank + rank_step, file + file_step
+    while in_bounds(rank, file):
+        moves.append((rank, file))
+        rank, file = rank + rank_step, file + file_step
+    return tuple(moves)
 
 
-def right_moves(rank, file):
-    return [(right, file) for right in range(rank + 1, 8)]
+def _hops(square, offsets):
+    rank, file = Bitboard.rank_file(square)
+    return tuple((rank + rank_step, file + file_step) for (rank_step, file_step) in offsets
+                 if in_bounds(rank + rank_step, file + file_step))
+
+
+def _mask(moves):
+    bitboard = 0
+    for (rank, file) in moves:
+        bitboard |= Bitboard.SQUARE_BITS[rank * 8 + file]
+    return bitboard
 
 
-def left_moves(rank, file):
-    return [(left, file) for left in range(0, rank)]
+# RAYS[direction][square] is the tuple of (rank, file) squares walking from square to the edge, nearest first
+RAYS = {direction: tuple(_ray(square, direction) for square in range(64)) for direction in QUEEN_DIRECTIONS}
+RAY_MASKS = {direction: tuple(_mask(ray) for ray in rays) for direction, rays in RAYS.items()}
 
+# per square, the rays a slider walks. these are what Piece.truncate_possible_moves consumes
+ROOK_RAYS = tuple(tuple(RAYS[direction][square] for direction in ROOK_DIRECTIONS) for square in range(64))
+BISHOP_RAYS = tuple(tuple(RAYS[direction][square] for direction in BISHOP_DIRECTIONS) for square in range(64))
+QUEEN_RAYS = tuple(ROOK_RAYS[square] + BISHOP_RAYS[square] for square in range(64))
 
-def up_moves(rank, file):
-    return [(rank, up) for up in range(rank + 1, 8)]
+KNIGHT_TARGETS = tuple(_hops(square, KNIGHT_OFFSETS) for square in range(64))
+KING_TARGETS = tuple(_hops(square, KING_OFFSETS) for square in range(64))
+KNIGHT_ATTACKS = tuple(_mask(targets) for targets in KNIGHT_TARGETS)
+KING_ATTACKS = tuple(_mask(targets) for targets in KING_TARGETS)
 
+# keyed by white. pushes include the double step from the starting rank, nearest first
+PAWN_PUSHES = {
+    True: tuple(_ray(square, DOWN)[:2 if square >> 3 == 6 else 1] for square in range(64)),
+    False: tuple(_ray(square, UP)[:2 if square >> 3 == 1 else 1] for square in range(64))
+}
+PAWN_CAPTURES = {
+    True: tuple(_hops(square, (DIAG_DOWN_LEFT, DIAG_DOWN_RIGHT)) for square in range(64)),
+    False: tuple(_hops(square, (DIAG_UP_LEFT, DIAG_UP_RIGHT)) for square in range(64))
+}
+PAWN_ATTACKS = {white: tuple(_mask(captures) for captures in PAWN_CAPTURES[white]) for white in (True, False)}
 
-def down_moves(rank, file):
-    return [(rank, down) for down in range(0, rank)]
 
+def _slider_attacks(square, occupied, directions):
+    attacks = 0
+    for direction in directions:
+        for (rank, file) in RAYS[direction][square]:
+            bit = Bitboard.SQUARE_BITS[rank * 8 + file]
+            attacks |= bit
+            if occupied & bit:
+                break
+    return attacks
 
-def diag_up_right_moves(rank, file):
-    dist_to_edge = min(8 - rank, 8 - file)
-    return [(rank + i, file + i) for i in range(1, dist_to_edge)]
 
+def _relevant_mask(square, directions):
+    # the last square of each ray never changes what the slider attacks, so it is left out of the index
+    return _mask(move for direction in directions for move in RAYS[direction][square][:-1])
 
-def diag_up_left_moves(rank, file):
-    dist_to_edge = min(rank, 8 - file)
-    return [(rank - i, file + i) for i in range(1, dist_to_edge)]
 
+def _occupancy_table(square, directions):
+    """
+    Every subset of the relevant blockers for a slider on square, mapped to the squares it attacks. Subsets are
+    enumerated with the carry-rippler trick.
+    """
+    mask = _relevant_mask(square, directions)
+    table = {}
+    subset = 0
+    while True:
+        table[subset] = _slider_attacks(square, subset, directions)
+        subset = (subset - mask) & mask
+        if not subset:
+            return mask, table
 
-def diag_down_right_moves(rank, file):
-    dist_to_edge = min(8 - rank, file)
-    return [(rank + i, file - i) for i in range(1, dist_to_edge)]
 
+_rook_tables = tuple(_occupancy_table(square, ROOK_DIRECTIONS) for square in range(64))
+_bishop_tables = tuple(_occupancy_table(square, BISHOP_DIRECTIONS) for square in range(64))
+ROOK_MASKS = tuple(mask for mask, _ in _rook_tables)
+ROOK_TABLES = tuple(table for _, table in _rook_tables)
+BISHOP_MASKS = tuple(mask for mask, _ in _bishop_tables)
+BISHOP_TABLES = tuple(table for _, table in _bishop_tables)
+del _rook_tables, _bishop_tables
 
-def diag_down_left_moves(rank, file):
-    dist_to_edge = min(rank, file)
-    return [(rank - i, file - i) for i in range(1, dist_to_edge)]
+
+# occupancy indexed slider lookups: the attacked squares (own pieces included) given every occupied square
+def rook_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+
+
+def bishop_attacks(square, occupied):
+    return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def queen_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]] | BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def _line_tables():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for square in range(64):
+        for direction in QUEEN_DIRECTIONS:
+            opposite = (-direction[0], -direction[1])
+            full_line = RAY_MASKS[direction][square] | RAY_MASKS[opposite][square] | Bitboard.SQUARE_BITS[square]
+            walked = 0
+            for (rank, file) in RAYS[direction][square]:
+                other = rank * 8 + file
+                between[square][other] = walked
+                line[square][other] = full_line
+                walked |= Bitboard.SQUARE_BITS[other]
+    return tuple(map(tuple, between)), tuple(map(tuple, line))
+
+
+# BETWEEN[a][b] is the squares strictly between a and b, LINE[a][b] the whole board edge to edge line through both.
+# both are empty when a and b don't share a rank, file or diagonal
+BETWEEN, LINE = _line_tables()
@@ -0,0 +1,102 @@
+"""
+Standard algebraic notation (SAN), the move text of PGN and most chess writing: Nbd7, exd6, O-O, e8=Q+ ...
+
+Reading resolves the text against the position's legal moves, so anything that names exactly one legal move is
+accepted: missing or extra disambiguation, a missing x, 0-0 for O-O, e8Q for e8=Q, e.p. and check or annotation
+suffixes. Writing produces the canonical form, disambiguating only as much as needed.
+"""
+import re
+
+from model import Conversions, FEN
+
+_SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+_SUFFIXES = re.compile(r'(\s*e\.p\.|[+#!?]+)+$')
+_COORDINATES = re.compile(r'^[a-h][1-8][a-h][1-8][qrbn]?$')
+
+
+def _is_castle(board, move):
+    piece = board.board[move[0] >> 3][move[0] & 7]
+    return piece.kind == 'king' and abs((move[1] & 7) - (move[0] & 7)) == 2
+
+
+def move_to_san(board, move, legal_moves=None):
+    """
+    SAN for a legal move in board's current position, with + or # for check or mate.
+    """
+    if legal_moves is None:
+        legal_moves = board.legal_moves()
+    from_square, to_square, promotion = move
+    piece = board.board[from_square >> 3][from_square & 7]
+
+    if _is_castle(board, move):
+        text = 'O-O' if to_square & 7 == 6 else 'O-O-O'
+    else:
+        capture = board.board[to_square >> 3][to_square & 7] is not None or \
+            (piece.kind == 'pawn' and to_square == board.en_passant)
+        destination = Conversions.square_to_algebraic(to_square)
+        if piece.kind == 'pawn':
+            text = (Conversions.square_to_algebraic(from_square)[0] + 'x' if capture else '') + destination
+            if promotion:
+                text += '=' + FEN.kind_to_fen[promotion].upper()
+        else:
+            # other pieces of the same kind that could also go there
+            rivals = [other for other in legal_moves if other[1] == to_square and other[0] != from_square and
+                      board.board[other[0] >> 3][other[0] & 7].kind == piece.kind]
+            disambiguation = ''
+            if rivals:
+                origin = Conversions.square_to_algebraic(from_square)
+                if all(other[0] & 7 != from_square & 7 for other in rivals):
+                    disambiguation = origin[0]
+                elif all(other[0] >> 3 != from_square >> 3 for other in rivals):
+                    disambiguation = origin[1]
+                else:
+                    disambiguation = origin
+            text = FEN.kind_to_fen[piece.kind].upper() + disambiguation + ('x' if capture else '') + destination
+
+    board.make_move(move)
+    if board.in_check():
+        text += '#' if not board.legal_moves() else '+'
+    board.unmake_move()
+    return text
+
+
+def san_to_move(board, text, legal_moves=None):
+    """
+    The legal move text names in board's current position. Raises ValueError if it names none, or more than one.
+    """
+    if legal_moves is None:
+        legal_moves = board.legal_moves()
+    san = _SUFFIXES.sub('', text.strip())
+
+    # coordinate notation, e.g. e2e4 or e7e8q, is read directly
+    if _COORDINATES.match(san):
+        move = Conversions.algebraic_to_move(san)
+        if move in legal_moves:
+            return move
+
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        file = 6 if san in ('O-O', '0-0') else 2
+        matches = [move for move in legal_moves if _is_castle(board, move) and move[1] & 7 == file]
+    else:
+        parsed = _SAN.match(san)
+        if not parsed:
+            raise ValueError(f'cannot read move {text!r}')
+        letter, from_file, from_rank, destination, promotion = parsed.groups()
+        kind = FEN.fen_to_kind[letter.lower()] if letter else 'pawn'
+        to_square = Conversions.algebraic_to_square(destination)
+        promotion = FEN.fen_to_kind[promotion.lower()] if promotion else None
+        matches = []
+        for move in legal_moves:
+            from_square = move[0]
+            if move[1] != to_square or move[2] != promotion:
+                continue
+            if board.board[from_square >> 3][from_square & 7].kind != kind:
+                continue
+            origin = Conversions.square_to_algebraic(from_square)
+            if (from_file and origin[0] != from_file) or (from_rank and origin[1] != from_rank):
+                continue
+            matches.append(move)
+
+    if len(matches) != 1:
+        raise ValueError(f'{text!r} is {"ambiguous" if matches else "not legal"} in {board.to_fen()}')
+    return matches[0]
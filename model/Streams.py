@@ -0,0 +1,49 @@
+"""
+Ordered, memory bounded parallel map over a stream.
+
+multiprocessing.Pool.imap pulls its whole input into a task queue as fast as it can read it, so on a large file its
+memory grows with the input rather than with the work in progress. ordered_map only ever reads ahead by in_flight
+items, and hands results back in input order as they become available.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+def _apply_chunk(function, chunk):
+    return [function(item) for item in chunk]
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ordered_map(function, items, workers=None, chunk_size=64, in_flight=None, initializer=None, initargs=()):
+    """
+    Yields function(item) for every item, in order, computed on a pool of worker processes. function must be
+    picklable (module level). Items go out in chunks of chunk_size, and at most in_flight chunks (by default two
+    per worker) are read ahead of the results consumed. workers=0 runs everything in this process.
+    """
+    if workers == 0:
+        if initializer:
+            initializer(*initargs)
+        for item in items:
+            yield function(item)
+        return
+
+    workers = workers or os.cpu_count()
+    in_flight = in_flight or workers * 2
+    with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for chunk in _chunks(items, chunk_size):
+            pending.append(pool.submit(_apply_chunk, function, chunk))
+            if len(pending) >= in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
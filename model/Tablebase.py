@@ -0,0 +1,249 @@
+"""
+Endgame tablebases: the result and distance to mate of every position of a small material balance, built offline
+by engine/Retrograde and read here.
+
+There is one file per material balance, named for it with the stronger side first (KQvK.tb, KRvKP.tb ...). White
+holds the first side's pieces in the file, and positions where black holds them are looked up with colors reversed.
+A file is one byte per position:
+    0           draw, or a position that can't arise
+    1 - 127     the side to move mates in that many moves
+    128 + n     the side to move is mated in n moves (128 is checkmate)
+
+Positions are laid out by Table.index: white to move then black to move, and within each the squares of the pieces
+in table order (white king, white's other pieces, black king, black's other pieces, each side in KQRBNP order) as
+base 64 digits. The white king's digit is narrowed by symmetry: with no pawns the board can be turned and reflected
+until it stands in the a1-d1-d4 triangle (10 squares), with pawns only reflected, onto files a to d (32 squares).
+
+Files are opened with mmap, so a probe costs an index computation and one byte read, and nothing is loaded up front.
+"""
+import mmap
+import os
+
+from model import Bitboard, FEN, Positions
+
+ORDER = 'KQRBNP'
+VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+MAX_PIECES = 4
+EXTENSION = '.tb'
+# material neither side can mate with, so it needs no file
+DRAWN = frozenset({'KvK', 'KBvK', 'KNvK'})
+
+LOSS = 128
+
+
+def encode(result, plies):
+    """
+    The stored byte for a result (1 win, 0 draw, -1 loss for the side to move) reached in plies plies.
+    """
+    if not result:
+        return 0
+    moves = (plies + 1) // 2 if result > 0 else plies // 2
+    if moves >= LOSS - 1:
+        raise ValueError(f'mate in {moves} moves does not fit in a byte')
+    return moves if result > 0 else LOSS + moves
+
+
+def decode(value):
+    """
+    (result, plies to mate) for a stored byte, the inverse of encode.
+    """
+    if not value:
+        return 0, 0
+    if value < LOSS:
+        return 1, value * 2 - 1
+    return -1, (value - LOSS) * 2
+
+
+def _symmetry(flip_file, flip_rank, swap):
+    mapping = []
+    for square in range(64):
+        x, y = square & 7, 7 - (square >> 3)
+        if flip_file:
+            x = 7 - x
+        if flip_rank:
+            y = 7 - y
+        if swap:
+            x, y = y, x
+        mapping.append((7 - y) * 8 + x)
+    return tuple(mapping)
+
+
+# the eight ways to turn or reflect the board, as square -> square maps
+SYMMETRIES = tuple(_symmetry(flip_file, flip_rank, swap)
+                   for swap in (False, True) for flip_rank in (False, True) for flip_file in (False, True))
+MIRROR = SYMMETRIES[1]
+# reflection in the a1-h8 diagonal
+DIAGONAL = SYMMETRIES[4]
+
+TRIANGLE = tuple(square for square in range(64) if 7 - (square >> 3) <= (square & 7) <= 3)
+HALF_BOARD = tuple(square for square in range(64) if square & 7 <= 3)
+# for each square, a symmetry taking it into the triangle
+_TO_TRIANGLE = tuple(next(symmetry for symmetry in SYMMETRIES if symmetry[square] in TRIANGLE)
+                     for square in range(64))
+
+
+def material_name(placed):
+    """
+    (table name, whether colors are reversed in it) for pieces given as (white, kind, ...) tuples.
+    """
+    sides = {True: [], False: []}
+    for piece in placed:
+        sides[piece[0]].append(FEN.kind_to_fen[piece[1]].upper())
+    white, black = (''.join(sorted(letters, key=ORDER.index)) for letters in (sides[True], sides[False]))
+
+    def strength(letters):
+        return sum(VALUES[c] for c in letters), tuple(-ORDER.index(c) for c in letters)
+
+    if strength(black) > strength(white):
+        return f'{black}v{white}', True
+    return f'{white}v{black}', False
+
+
+class Table:
+    """
+    The layout of one material balance's file, over data: anything indexable by byte (bytes, bytearray, mmap).
+    """
+
+    def __init__(self, name, data=None):
+        self.name = name
+        sides = name.split('v')
+        if len(sides) != 2 or not all(side.startswith('K') and side.count('K') == 1 for side in sides) or \
+                any(c not in ORDER for c in ''.join(sides)):
+            raise ValueError(f'not a material balance: {name!r}')
+        self.pieces = [(white, FEN.fen_to_kind[c.lower()])
+                       for white, side in ((True, sides[0]), (False, sides[1]))
+                       for c in sorted(side, key=ORDER.index)]
+        if len(self.pieces) > MAX_PIECES:
+            raise ValueError(f'{name} has more than {MAX_PIECES} pieces')
+        self.has_pawns = 'P' in name
+        self.king_squares = HALF_BOARD if self.has_pawns else TRIANGLE
+        self.king_slots = {square: slot for slot, square in enumerate(self.king_squares)}
+        self.half = len(self.king_squares) * 64 ** (len(self.pieces) - 1)
+        self.size = self.half * 2
+        # runs of identical pieces, whose squares are kept sorted so each position has one index
+        self.runs = []
+        start = 0
+        for end in range(1, len(self.pieces) + 1):
+            if end == len(self.pieces) or self.pieces[end] != self.pieces[start]:
+                if end - start > 1:
+                    self.runs.append((start, end))
+                start = end
+        self.data = data
+
+    def _sort_runs(self, squares):
+        for start, end in self.runs:
+            squares[start:end] = sorted(squares[start:end])
+        return squares
+
+    def canonical(self, squares):
+        """
+        squares (in table order) under the symmetry the index uses, so that every position has exactly one index.
+        """
+        king = squares[0]
+        if self.has_pawns:
+            squares = [MIRROR[square] for square in squares] if king & 7 > 3 else list(squares)
+            return self._sort_runs(squares)
+        symmetry = _TO_TRIANGLE[king]
+        squares = self._sort_runs([symmetry[square] for square in squares])
+        if (squares[0] & 7) == 7 - (squares[0] >> 3):
+            # the king is on the diagonal, which reflects onto itself: keep whichever reflection sorts first
+            reflected = self._sort_runs([DIAGONAL[square] for square in squares])
+            if reflected < squares:
+                squares = reflected
+        return squares
+
+    def index(self, squares, white_to_move):
+        squares = self.canonical(squares)
+        index = self.king_slots[squares[0]]
+        for square in squares[1:]:
+            index = index * 64 + square
+        return index if white_to_move else index + self.half
+
+    def position(self, index):
+        """
+        (squares, white to move) at index, the inverse of index for canonical positions.
+        """
+        white_to_move = index < self.half
+        if not white_to_move:
+            index -= self.half
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        squares.append(self.king_squares[index])
+        squares.reverse()
+        return squares, white_to_move
+
+    def squares_of(self, placed):
+        """
+        The squares of (white, kind, square) pieces in table order. The pieces must match the table's.
+        """
+        ordered = sorted(placed, key=lambda piece: (not piece[0], ORDER.index(FEN.kind_to_fen[piece[1]].upper())))
+        return [piece[2] for piece in ordered]
+
+    def value(self, squares, white_to_move):
+        return self.data[self.index(squares, white_to_move)]
+
+
+class Tablebases:
+    """
+    The tables in a directory, each opened (with mmap) the first time it's probed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.names = {file[:-len(EXTENSION)] for file in os.listdir(directory) if file.endswith(EXTENSION)}
+        self.tables = {}
+        self.files = []
+
+    def table(self, name):
+        if name not in self.tables:
+            if name not in self.names:
+                return None
+            file = open(os.path.join(self.directory, name + EXTENSION), 'rb')
+            table = Table(name, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            if len(table.data) != table.size:
+                raise ValueError(f'{file.name} is {len(table.data)} bytes, expected {table.size}')
+            self.files.append(file)
+            self.tables[name] = table
+        return self.tables[name]
+
+    def lookup(self, placed, white_to_move):
+        """
+        The stored byte for pieces given as (white, kind, square) with white_to_move, or None without a table.
+        """
+        name, reverse = material_name(placed)
+        if name in DRAWN:
+            return 0
+        table = self.table(name)
+        if table is None:
+            return None
+        if reverse:
+            placed = [(not white, kind, square ^ 56) for white, kind, square in placed]
+            white_to_move = not white_to_move
+        return table.value(table.squares_of(placed), white_to_move)
+
+    def probe(self, board):
+        """
+        (result, plies to mate) for board's side to move, result 1 for a win, 0 a draw and -1 a loss, or None if
+        the position isn't covered: too many pieces, no table, castling rights or an en passant capture (which the
+        tables leave out). Distances ignore the fifty move rule.
+        """
+        if Bitboard.popcount(board.occupied) > MAX_PIECES or board.white_castles_king or \
+                board.white_castles_queen or board.black_castles_king or board.black_castles_queen:
+            return None
+        white_to_move = board.white_to_move
+        if board.en_passant is not None and \
+                Positions.PAWN_ATTACKS[not white_to_move][board.en_passant] & board.bitboards[white_to_move]['pawn']:
+            return None
+        placed = [(white, kind, square) for white, kinds in board.bitboards.items()
+                  for kind, bitboard in kinds.items() for square in Bitboard.squares(bitboard)]
+        value = self.lookup(placed, white_to_move)
+        return None if value is None else decode(value)
+
+    def close(self):
+        for table in self.tables.values():
+            table.data.close()
+        for file in self.files:
+            file.close()
+        self.tables, self.files = {}, []
@@ -0,0 +1,54 @@
+"""
+Zobrist hashing: every (color, kind, square), castling right, en passant file and the side to move gets a random 64
+bit key, and a position's key is the xor of the keys of everything true about it. Because xor is its own inverse, the
+Board keeps its key up to date as pieces come and go rather than recomputing it.
+The en passant file only counts when a capture there is possible (see en_passant_counts), so keys tell positions
+apart exactly as the repetition rule does.
+
+The keys come from a fixed seed so that every process (see the parallel search) agrees on them.
+"""
+import random
+
+from model import Bitboard, Positions
+
+_random = random.Random(0x5EED)
+
+
+def _key():
+    return _random.getrandbits(64)
+
+
+PIECE_KEYS = {white: {kind: tuple(_key() for _ in range(64)) for kind in Bitboard.KINDS} for white in (True, False)}
+CASTLE_KEYS = {right: _key() for right in
+               ('white_castles_king', 'white_castles_queen', 'black_castles_king', 'black_castles_queen')}
+EN_PASSANT_KEYS = tuple(_key() for _ in range(8))
+WHITE_TO_MOVE_KEY = _key()
+
+
+def en_passant_counts(board):
+    """
+    Whether board's en passant square is part of its key: only when the side to move has a pawn that could take
+    there, so that positions that differ in nothing else (as far as repetition goes) share a key.
+    """
+    return board.en_passant is not None and \
+        bool(Positions.PAWN_ATTACKS[not board.white_to_move][board.en_passant] &
+             board.bitboards[board.white_to_move]['pawn'])
+
+
+def compute(board):
+    """
+    The key of board from scratch. Board maintains this incrementally, so this is for setup and checking.
+    """
+    key = 0
+    for white, kinds in board.bitboards.items():
+        for kind, bitboard in kinds.items():
+            for square in Bitboard.squares(bitboard):
+                key ^= PIECE_KEYS[white][kind][square]
+    for right, right_key in CASTLE_KEYS.items():
+        if getattr(board, right):
+            key ^= right_key
+    if en_passant_counts(board):
+        key ^= EN_PASSANT_KEYS[board.en_passant & 7]
+    if board.white_to_move:
+        key ^= WHITE_TO_MOVE_KEY
+    return key